@@ -14,7 +14,8 @@ from qgis.core import (
     QgsMapLayer, QgsWkbTypes, QgsEditorWidgetSetup, QgsCoordinateTransform,
     QgsApplication, QgsRasterFileWriter, QgsProcessingFeedback,
     QgsCategorizedSymbolRenderer, QgsSymbol, QgsRendererCategory, QgsSimpleFillSymbolLayer,
-    QgsFillSymbol, QgsRandomColorRamp
+    QgsFillSymbol, QgsRandomColorRamp, QgsFeatureRequest, QgsSpatialIndex,
+    QgsTask, QgsProcessingAlgRunnerTask, QgsProcessingContext
 )
 from qgis.analysis import QgsRasterCalculator, QgsRasterCalculatorEntry
 import processing
@@ -24,10 +25,237 @@ from qgis.core import Qgis
 from pathlib import Path
 import os
 import csv
+import hashlib
+import io
+import math
+import json
+import tarfile
+import time
+import uuid
+from contextlib import contextmanager
 from datetime import datetime
 def log_debug(msg):
     QgsMessageLog.logMessage(str(msg), tag="HabTile", level=Qgis.Info)
 
+class _NoSpan:
+    """Shared do-nothing span handed out while profiling is off"""
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+class _Span:
+    __slots__ = ('profiler', 'name', 'start')
+
+    def __init__(self, profiler, name):
+        self.profiler = profiler
+        self.name = name
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        self.profiler.observe(self.name, (time.perf_counter() - self.start) * 1000.0)
+        return False
+
+class Profiler:
+    """Session profile of HabTile hot paths
+
+    span(name) times a block into the name histogram (milliseconds),
+    count(name) bumps a counter and observe(name, value) adds any sample to
+    a histogram. Profiling is off by default: span() then returns one
+    shared no-op context manager and count() and observe() return at once.
+    Turn it on with the plugin's Profile action, PROFILER.enabled = True or
+    HABTILE_PROFILE=1 in the environment.
+    """
+    _NO_SPAN = _NoSpan()
+
+    def __init__(self, enabled=False):
+        self.enabled = enabled
+        self.reset()
+
+    def reset(self):
+        self.samples = {}
+        self.counters = {}
+
+    def span(self, name):
+        if not self.enabled:
+            return self._NO_SPAN
+        return _Span(self, name)
+
+    def count(self, name, n=1):
+        if self.enabled:
+            self.counters[name] = self.counters.get(name, 0) + n
+
+    def observe(self, name, value):
+        if self.enabled:
+            self.samples.setdefault(name, []).append(value)
+
+    def summary(self):
+        """name -> count, total, mean, p50, p90, p99 and max of each histogram"""
+        rows = {}
+        for name, values in self.samples.items():
+            ordered = sorted(values)
+            n = len(ordered)
+            rows[name] = {
+                "count": n,
+                "total": sum(ordered),
+                "mean": sum(ordered) / n,
+                "p50": ordered[int(0.5 * (n - 1))],
+                "p90": ordered[int(0.9 * (n - 1))],
+                "p99": ordered[int(0.99 * (n - 1))],
+                "max": ordered[-1],
+            }
+        return rows
+
+    def dump_json(self, path):
+        with open(path, 'w') as f:
+            json.dump({"histograms": self.summary(), "counters": self.counters}, f, indent=1)
+
+    def dump_csv(self, path):
+        columns = ["count", "total", "mean", "p50", "p90", "p99", "max"]
+        with open(path, 'w', newline='') as f:
+            writer = csv.writer(f)
+            writer.writerow(["name", "kind"] + columns)
+            for name, row in sorted(self.summary().items()):
+                writer.writerow([name, "histogram"] + [row[column] for column in columns])
+            for name, value in sorted(self.counters.items()):
+                writer.writerow([name, "counter", value] + [""] * (len(columns) - 1))
+
+    def log(self):
+        """Write the profile to the HabTile log"""
+        for name, row in sorted(self.summary().items()):
+            log_debug(f"Profile {name}: n={row['count']} mean={row['mean']:.3f} "
+                      f"p50={row['p50']:.3f} p90={row['p90']:.3f} max={row['max']:.3f}")
+        for name, value in sorted(self.counters.items()):
+            log_debug(f"Profile {name}: {value}")
+
+PROFILER = Profiler(enabled=os.environ.get("HABTILE_PROFILE", "") not in ("", "0"))
+
+# (name, type, length) of the fields every habitat layer has
+HABITAT_LAYER_FIELDS = [
+    ("habitat_1", QVariant.String, 40),
+    ("habitat_2", QVariant.String, 40),
+    ("habitat_3", QVariant.String, 40),
+    ("habitat_4", QVariant.String, 40),
+    ("notes", QVariant.String, 255),
+    ("source_raster", QVariant.String, 100),
+    ("pixel_size", QVariant.Double, None),
+    ("tile_id", QVariant.String, 100),
+    ("box_size_m", QVariant.Double, None),
+    ("box_size_pixel", QVariant.Int, None),
+    ("center_x", QVariant.Double, None),
+    ("center_y", QVariant.Double, None)
+]
+
+def disconnect_signal(signal, slot):
+    """Disconnect slot from signal, ignoring connections already gone"""
+    try:
+        signal.disconnect(slot)
+    except (TypeError, RuntimeError):
+        pass
+
+def box_iou(a, b):
+    """Intersection over union of two tile geometries"""
+    inter = a.intersection(b).area()
+    if inter <= 0:
+        return 0.0
+    return inter / (a.area() + b.area() - inter)
+
+class TileIndex:
+    """Spatial index over the tiles of a habitat layer, kept up to date from its edit signals"""
+
+    def __init__(self, layer):
+        self.layer = layer
+        request = QgsFeatureRequest().setNoAttributes()
+        self.index = QgsSpatialIndex(layer.getFeatures(request), flags=QgsSpatialIndex.FlagStoreFeatureGeometries)
+        # ids of features added in the edit buffer, replaced on commit
+        self._uncommitted = set()
+        # provider writes bypass the edit signals; HabTile.tile_index rebuilds a stale index
+        self.stale = False
+        layer.dataChanged.connect(self._data_changed)
+        layer.featureAdded.connect(self._feature_added)
+        layer.featureDeleted.connect(self._feature_deleted)
+        layer.geometryChanged.connect(self._geometry_changed)
+        layer.committedFeaturesAdded.connect(self._committed_features_added)
+
+    def _data_changed(self):
+        self.stale = True
+
+    def _feature_added(self, fid):
+        feature = self.layer.getFeature(fid)
+        if feature.hasGeometry():
+            self.index.addFeature(feature)
+            if fid < 0:
+                self._uncommitted.add(fid)
+
+    def _feature_deleted(self, fid):
+        geometry = self.index.geometry(fid)
+        if not geometry.isNull():
+            self.index.deleteFeature(self._feature(fid, geometry))
+        self._uncommitted.discard(fid)
+
+    def _geometry_changed(self, fid, geometry):
+        self._feature_deleted(fid)
+        self.index.addFeature(self._feature(fid, geometry))
+        if fid < 0:
+            self._uncommitted.add(fid)
+
+    def _committed_features_added(self, layer_id, features):
+        for fid in list(self._uncommitted):
+            self._feature_deleted(fid)
+        for feature in features:
+            if feature.hasGeometry():
+                self.index.addFeature(feature)
+
+    @staticmethod
+    def _feature(fid, geometry):
+        feature = QgsFeature(fid)
+        feature.setGeometry(geometry)
+        return feature
+
+    def overlapping(self, geometry, min_iou):
+        """(fid, iou) of tiles overlapping geometry by at least min_iou, best first"""
+        matches = []
+        for fid in self.index.intersects(geometry.boundingBox()):
+            iou = box_iou(geometry, self.index.geometry(fid))
+            if iou >= min_iou:
+                matches.append((fid, iou))
+        matches.sort(key=lambda match: -match[1])
+        return matches
+
+    def disconnect(self):
+        disconnect_signal(self.layer.dataChanged, self._data_changed)
+        disconnect_signal(self.layer.featureAdded, self._feature_added)
+        disconnect_signal(self.layer.featureDeleted, self._feature_deleted)
+        disconnect_signal(self.layer.geometryChanged, self._geometry_changed)
+        disconnect_signal(self.layer.committedFeaturesAdded, self._committed_features_added)
+
+class EditRecorder:
+    """Ids of the features of a layer edited or deleted after it was created
+
+    Lets edits made while a background task works on a snapshot of the
+    layer be carried over to the task's result.
+    """
+
+    def __init__(self, layer):
+        self.layer = layer
+        self.fids = set()
+        layer.featureDeleted.connect(self._edited)
+        layer.geometryChanged.connect(self._edited)
+        layer.attributeValueChanged.connect(self._edited)
+
+    def _edited(self, fid, *args):
+        self.fids.add(fid)
+
+    def disconnect(self):
+        disconnect_signal(self.layer.featureDeleted, self._edited)
+        disconnect_signal(self.layer.geometryChanged, self._edited)
+        disconnect_signal(self.layer.attributeValueChanged, self._edited)
+
 class HabTile(QgsMapTool):
     """Custom map tool for habitat classification"""
     
@@ -47,43 +275,167 @@ class HabTile(QgsMapTool):
         self.habitat_types = []
         self.color_types=[]
         self.habitat_types,self.habitat_colors = self.load_or_create_habitat_types()
+        # (canvas crs, raster crs) -> (to raster, from raster) transforms
+        self._transforms = {}
+        self.canvas.destinationCrsChanged.connect(self.clear_transform_cache)
+        QgsProject.instance().transformContextChanged.connect(self.clear_transform_cache)
+        # raster layer id -> resolved habitat layer, see setup_habitat_layer
+        self._resolved_layers = {}
+        # layer id -> layer whose renames and field changes clear the cache
+        self._watched_layers = {}
+        QgsProject.instance().layersAdded.connect(self.clear_layer_cache)
+        QgsProject.instance().layersRemoved.connect(self._layers_removed)
+        # rapid annotation: Ctrl+click tiles stay in the edit buffer and are
+        # committed in batches of rapid_batch_size or after rapid_idle_ms
+        self.rapid_mode = False
+        self.rapid_batch_size = 25
+        self.rapid_idle_ms = 2000
+        self._pending_layer = None
+        self._pending_count = 0
+        self._commit_timer = QTimer()
+        self._commit_timer.setSingleShot(True)
+        self._commit_timer.timeout.connect(self.commit_pending)
+        QgsProject.instance().layersWillBeRemoved.connect(self._layers_will_be_removed)
+        # habitat layer id -> TileIndex; clicks whose tile overlaps an
+        # existing one by duplicate_iou or more do not add a new tile
+        self.duplicate_iou = 0.5
+        self._tile_indexes = {}
+        # running scratch layer save, see save_scratch_layer_with_dialog
+        self._save_task = None
 
         
     
+    def commit_pending(self):
+        """Commit tiles buffered by rapid annotation mode"""
+        self._commit_timer.stop()
+        layer = self._pending_layer
+        if self._pending_count and layer is not None and layer.isEditable():
+            with PROFILER.span("rapid.commit"):
+                committed = layer.commitChanges()
+            if not committed:
+                log_debug(f"Rapid annotation commit failed: {layer.commitErrors()}")
+            else:
+                log_debug(f"Committed {self._pending_count} tiles to {layer.name()}")
+        self._pending_layer = None
+        self._pending_count = 0
+
+    def _layers_will_be_removed(self, layer_ids):
+        if self._pending_layer is not None and self._pending_layer.id() in layer_ids:
+            self.commit_pending()
+
+    def rapid_add(self, feature):
+        """Add feature to the edit buffer and commit once the batch is full or idle"""
+        layer = self.habitat_layer
+        if self._pending_layer is not None and self._pending_layer is not layer:
+            self.commit_pending()
+        if not layer.isEditable():
+            layer.startEditing()
+        layer.addFeature(feature)
+        self._pending_layer = layer
+        self._pending_count += 1
+        if self._pending_count >= self.rapid_batch_size:
+            self.commit_pending()
+        else:
+            self._commit_timer.start(self.rapid_idle_ms)
+        # only the habitat layer is redrawn, other layers keep their cached images
+        layer.triggerRepaint()
+
+    def deactivate(self):
+        self.commit_pending()
+        super().deactivate()
+
+    def clear_layer_cache(self, *args):
+        self._resolved_layers = {}
+
+    def _layers_removed(self, layer_ids):
+        for layer_id in layer_ids:
+            self._watched_layers.pop(layer_id, None)
+            self._tile_indexes.pop(layer_id, None)
+        self.clear_layer_cache()
+
+    def tile_index(self, layer):
+        """TileIndex of layer, built on first use and rebuilt once stale"""
+        index = self._tile_indexes.get(layer.id())
+        if index is not None and index.stale:
+            index.disconnect()
+            index = None
+        if index is None:
+            index = TileIndex(layer)
+            self._tile_indexes[layer.id()] = index
+        return index
+
+    def find_duplicate(self, geometry):
+        """Id of the existing tile that geometry (in canvas CRS) duplicates, or None"""
+        layer = self.habitat_layer
+        canvas_crs = self.canvas.mapSettings().destinationCrs()
+        if layer.crs() != canvas_crs:
+            geometry = QgsGeometry(geometry)
+            geometry.transform(self.get_transforms(layer.crs())[0])
+        matches = self.tile_index(layer).overlapping(geometry, self.duplicate_iou)
+        return matches[0][0] if matches else None
+
+    def edit_existing(self, fid, quick):
+        """Select the tile fid instead of adding a duplicate
+
+        A quick add is rejected; a normal click opens the existing tile's
+        form for editing.
+        """
+        layer = self.habitat_layer
+        layer.selectByIds([fid])
+        if quick:
+            log_debug(f"Rejected duplicate tile over feature {fid} in {layer.name()}")
+            iface.messageBar().pushInfo("HabTile", "A tile already covers this spot; it has been selected.")
+            return
+        layer.startEditing()
+        dialog = iface.getFeatureForm(layer, layer.getFeature(fid))
+        if dialog.exec_() == QDialog.Accepted:
+            layer.commitChanges()
+        else:
+            layer.rollBack()
+        self.canvas.refresh()
+
+    def _watch_layer(self, layer):
+        """Drop cached habitat layers when layer is renamed or its fields change"""
+        if layer.id() in self._watched_layers:
+            return
+        self._watched_layers[layer.id()] = layer
+        layer.nameChanged.connect(self.clear_layer_cache)
+        if layer.type() == QgsMapLayer.VectorLayer:
+            layer.updatedFields.connect(self.clear_layer_cache)
+
     def setup_habitat_layer(self):
-        self.habitat_layer = None
+        """Resolve the habitat layer for the selected raster
+
+        The layer found for a raster is cached, so repeated clicks skip the
+        project scan, field checks and form setup until a layer is added or
+        removed, or the raster or habitat layer is renamed or its fields
+        change.
+        """
         pixel_size, raster_name, raster_crs,raster_layer = self.get_selected_raster_info()
         if not pixel_size or not raster_name or not raster_crs or not raster_crs.isValid():
+            self.habitat_layer = None
             QMessageBox.warning(
                 None,
                 "No Raster Selected",
                 "Please select a valid automosaic raster layer first."
             )
             return
+        cached = self._resolved_layers.get(raster_layer.id())
+        if cached is not None:
+            PROFILER.count("habitat_layer.cache_hit")
+            self.habitat_layer = cached
+            return
+        PROFILER.count("habitat_layer.cache_miss")
+        self.habitat_layer = None
         layer_name = f"Habitat_{raster_name}".lower()
-        required_fields = [
-            ("habitat_1", QVariant.String, 40),
-            ("habitat_2", QVariant.String, 40),
-            ("habitat_3", QVariant.String, 40),
-            ("habitat_4", QVariant.String, 40),
-            ("notes", QVariant.String, 255),
-            ("source_raster", QVariant.String, 100),
-            ("pixel_size", QVariant.Double, None),
-            ("tile_id", QVariant.String, 100),
-            ("box_size_m", QVariant.Double, None),
-            ("box_size_pixel", QVariant.Int, None),
-            ("center_x", QVariant.Double, None),
-            ("center_y", QVariant.Double, None)
-        ]
+        required_fields = HABITAT_LAYER_FIELDS
 
         # Try to find an existing layer
         for layer in QgsProject.instance().mapLayers().values():
             if layer.name().startswith(layer_name) and layer.type() == QgsMapLayer.VectorLayer:
                 # Add missing fields if needed
-                missing = []
-                for name, qtype, length in required_fields:
-                    if name not in [f.name() for f in layer.fields()]:
-                        missing.append((name, qtype, length))
+                field_names = set(layer.fields().names())
+                missing = [field for field in required_fields if field[0] not in field_names]
                 if missing:
                     layer.startEditing()
                     for name, qtype, length in missing:
@@ -96,6 +448,9 @@ class HabTile(QgsMapTool):
                 self.habitat_layer = layer
                 self.set_symbology()
                 self.configure_attribute_form()
+                self._resolved_layers[raster_layer.id()] = layer
+                self._watch_layer(layer)
+                self._watch_layer(raster_layer)
                 return
         # If habitat layer not found, prompt to create
         reply = QMessageBox.question(
@@ -129,6 +484,64 @@ class HabTile(QgsMapTool):
 
 
 
+    def clear_transform_cache(self):
+        self._transforms = {}
+
+    def disconnect_signals(self):
+        """Disconnect from canvas and project signals when the plugin unloads"""
+        project = QgsProject.instance()
+        disconnect_signal(self.canvas.destinationCrsChanged, self.clear_transform_cache)
+        disconnect_signal(project.transformContextChanged, self.clear_transform_cache)
+        disconnect_signal(project.layersAdded, self.clear_layer_cache)
+        disconnect_signal(project.layersRemoved, self._layers_removed)
+        disconnect_signal(project.layersWillBeRemoved, self._layers_will_be_removed)
+        for layer in self._watched_layers.values():
+            disconnect_signal(layer.nameChanged, self.clear_layer_cache)
+            if layer.type() == QgsMapLayer.VectorLayer:
+                disconnect_signal(layer.updatedFields, self.clear_layer_cache)
+        self._watched_layers = {}
+        for index in self._tile_indexes.values():
+            index.disconnect()
+        self._tile_indexes = {}
+
+    def get_transforms(self, raster_crs):
+        """Cached transforms between the canvas CRS and raster_crs
+
+        Returns (to_raster, from_raster). The cache is cleared when the
+        canvas CRS or the project transform context changes.
+        """
+        canvas_crs = self.canvas.mapSettings().destinationCrs()
+        key = (canvas_crs.authid() or canvas_crs.toWkt(), raster_crs.authid() or raster_crs.toWkt())
+        transforms = self._transforms.get(key)
+        if transforms is None:
+            PROFILER.count("transforms.cache_miss")
+            project = QgsProject.instance()
+            transforms = (
+                QgsCoordinateTransform(canvas_crs, raster_crs, project),
+                QgsCoordinateTransform(raster_crs, canvas_crs, project)
+            )
+            self._transforms[key] = transforms
+        return transforms
+
+    def tile_geometry(self, raster_point, pixel_size, raster_crs):
+        """Square box of box_size_pixel pixels around raster_point, in canvas CRS
+
+        Returns (geometry, box_size_m).
+        """
+        box_size_m = self.box_size_pixel * pixel_size
+        half_box = box_size_m / 2
+        # Create rectangle geometry in raster CRS
+        rect = QgsRectangle(
+            raster_point.x() - half_box,
+            raster_point.y() - half_box,
+            raster_point.x() + half_box,
+            raster_point.y() + half_box
+        )
+        geometry = QgsGeometry.fromRect(rect)
+        # Transform geometry back to map CRS
+        geometry.transform(self.get_transforms(raster_crs)[1])
+        return geometry, box_size_m
+
     def set_symbology(self):
         # Setup the categorized renderer
         categories = []
@@ -262,9 +675,17 @@ class HabTile(QgsMapTool):
         return default_dir / filename
 
     def save_scratch_layer_with_dialog(self,layer):
+        """Open a dialog box to save a scratch layer to GeoPackage.
+
+        The features are snapshotted and written by native:savefeatures in a
+        background task, so editing can go on; scratch_layer_saved swaps in
+        the saved layer when it finishes. Returns the chosen path, or None.
+        """
         if not layer.isValid():
             raise ValueError("Layer is not valid")
-        """Open a dialog box to save a scratch layer to GeoPackage."""
+        if self._save_task is not None:
+            # one save at a time, the running one will swap the layer
+            return None
         default_path = self.suggest_save_path(layer)
 
         # Open file save dialog with default path filled in
@@ -283,35 +704,63 @@ class HabTile(QgsMapTool):
         if not os.access(os.path.dirname(file_path), os.W_OK):
             QMessageBox.critical(None, "Save Error", f"Cannot write to directory: {os.path.dirname(file_path)}")
             return None
-        import processing
+        self.commit_pending()
+        # copy the features now; tiles added, edited or deleted while the task
+        # runs are carried over to the saved layer by scratch_layer_saved
+        snapshot = layer.materialize(QgsFeatureRequest())
+        request = QgsFeatureRequest().setSubsetOfAttributes(["tile_id"], layer.fields())
+        request.setFlags(QgsFeatureRequest.NoGeometry)
+        snapshot_tile_ids = {feature.id(): feature["tile_id"] for feature in layer.getFeatures(request)}
+        edited = EditRecorder(layer)
+        renderer = layer.renderer().clone()
         params = {
-            'INPUT': layer,
+            'INPUT': snapshot,
             'OUTPUT': file_path,
-            #'LAYER_NAME': layer.name(),
             'OVERWRITE': True
         }
-        try:
-            
-            # After saving with processing.run("native:savefeatures", params)
-            # Hold the renderer from the memory layer
-            renderer = layer.renderer().clone()
-            result = processing.run("native:savefeatures", params)
-
-
-
-            saved_layer_path = result['OUTPUT']
-            # Export symbology to QML
-            qml_path = saved_layer_path.replace(".gpkg", ".qml")
-            layer.saveNamedStyle(qml_path)
+        context = QgsProcessingContext()
+        context.setProject(QgsProject.instance())
+        feedback = QgsProcessingFeedback()
+        alg = QgsApplication.processingRegistry().algorithmById("native:savefeatures")
+        task = QgsProcessingAlgRunnerTask(alg, params, context, feedback)
+        layer_id, layer_name = layer.id(), layer.name()
+        task.executed.connect(
+            lambda ok, results: self.scratch_layer_saved(
+                layer_id, layer_name, file_path, renderer, snapshot_tile_ids, edited, ok, results
+            )
+        )
+        # keep the task's context, feedback and snapshot alive until it finishes
+        self._save_task = (task, context, feedback, snapshot)
+        QgsApplication.taskManager().addTask(task)
+        return file_path
 
+    def scratch_layer_saved(self, layer_id, layer_name, file_path, renderer, snapshot_tile_ids, edited,
+                            ok, results):
+        """Replace the scratch layer with the GeoPackage written by the save task"""
+        self._save_task = None
+        if not ok:
+            edited.disconnect()
+            QMessageBox.critical(None, "Save Error", f"Error saving layer to {file_path}")
+            return
+        layer = QgsProject.instance().mapLayer(layer_id)
+        try:
+            saved_layer_path = results['OUTPUT']
+            if layer is not None:
+                # Export symbology to QML
+                qml_path = saved_layer_path.replace(".gpkg", ".qml")
+                layer.saveNamedStyle(qml_path)
 
             saved_layer = QgsVectorLayer(saved_layer_path, '', "ogr")
             saved_layer.setRenderer(renderer)
             if saved_layer.isValid():
-                saved_layer.setName(layer.name())  # Set to original name
+                saved_layer.setName(layer_name)  # Set to original name
+                if layer is not None:
+                    self.copy_edits(layer, saved_layer, snapshot_tile_ids, edited)
                 QgsProject.instance().addMapLayer(saved_layer)
-                QgsProject.instance().removeMapLayer(layer.id())
+                if layer is not None:
+                    QgsProject.instance().removeMapLayer(layer_id)
                 self.habitat_layer = saved_layer
+                self.habitat_layer_saved = True
                 self.set_symbology()
                 # Save style to GeoPackage
                 try:
@@ -320,8 +769,39 @@ class HabTile(QgsMapTool):
                     QgsMessageLog.logMessage(f"Could not save style: {e}", level=Qgis.Warning)
         except Exception as e:
             QMessageBox.critical(None, "Save Error", f"Error saving layer:\n{str(e)}")
-            return None
-        return file_path
+        finally:
+            edited.disconnect()
+
+    def copy_edits(self, layer, saved_layer, snapshot_tile_ids, edited):
+        """Carry the edits made to layer while it was saved over to saved_layer
+
+        snapshot_tile_ids maps the fids of the saved snapshot to their
+        tile_id. Tiles added since are copied; snapshot tiles that were edited
+        or deleted (recorded by the EditRecorder edited) are removed from
+        saved_layer by tile_id and copied again if they still exist.
+        """
+        self.commit_pending()
+        replaced = {snapshot_tile_ids[fid] for fid in edited.fids if fid in snapshot_tile_ids}
+        if replaced:
+            request = QgsFeatureRequest().setSubsetOfAttributes(["tile_id"], saved_layer.fields())
+            request.setFlags(QgsFeatureRequest.NoGeometry)
+            stale = [feature.id() for feature in saved_layer.getFeatures(request) if feature["tile_id"] in replaced]
+            saved_layer.dataProvider().deleteFeatures(stale)
+        copy_ids = [fid for fid in layer.allFeatureIds() if fid not in snapshot_tile_ids or fid in edited.fids]
+        if not copy_ids:
+            return
+        fields = saved_layer.fields()
+        copies = []
+        for feature in layer.getFeatures(QgsFeatureRequest().setFilterFids(copy_ids)):
+            copy = QgsFeature(fields)
+            copy.setGeometry(feature.geometry())
+            for name in feature.fields().names():
+                idx = fields.indexFromName(name)
+                if idx != -1 and name != "fid":
+                    copy.setAttribute(idx, feature[name])
+            copies.append(copy)
+        saved_layer.dataProvider().addFeatures(copies)
+        log_debug(f"Copied {len(copies)} tiles added or edited during the save to {saved_layer.name()}")
 
 
 
@@ -335,44 +815,39 @@ class HabTile(QgsMapTool):
         # Check if Ctrl key is pressed
         modifiers = event.modifiers()
         is_ctrl_click = bool(modifiers & Qt.ControlModifier)
+        PROFILER.count("click")
         pixel_size, raster_name, raster_crs, raster_layer = self.get_selected_raster_info()  
-        self.setup_habitat_layer()
+        with PROFILER.span("click.setup_habitat_layer"):
+            self.setup_habitat_layer()
         if self.habitat_layer: 
-            # Transform point to raster's CRS for accurate size calculation
-            transform = QgsCoordinateTransform(
-                self.canvas.mapSettings().destinationCrs(),
-                raster_crs,
-                QgsProject.instance()
-            )
-            transformed_point = transform.transform(point)
-            
-            # Calculate 256x256 pixel box size in raster units
-            box_size_m = self.box_size_pixel * pixel_size
-            half_box = box_size_m / 2
-            
-            # Create rectangle geometry in raster CRS
-            rect = QgsRectangle(
-                transformed_point.x() - half_box,
-                transformed_point.y() - half_box,
-                transformed_point.x() + half_box,
-                transformed_point.y() + half_box
-            )
-            geometry = QgsGeometry.fromRect(rect)
-            
-            # Transform geometry back to map CRS
-            transform_back = QgsCoordinateTransform(
-                raster_crs,
-                self.canvas.mapSettings().destinationCrs(),
-                QgsProject.instance()
-            )
-            geometry.transform(transform_back)
-            
+            with PROFILER.span("click.tile_geometry"):
+                # Transform point to raster's CRS for accurate size calculation
+                transformed_point = self.get_transforms(raster_crs)[0].transform(point)
+
+                # Calculate 256x256 pixel box in raster units, back in map CRS
+                geometry, box_size_m = self.tile_geometry(transformed_point, pixel_size, raster_crs)
+
+            quick = is_ctrl_click and bool(self.last_habitat_main_1)
+            if not (quick and self.rapid_mode):
+                # commit buffered tiles first so their ids are final and a
+                # cancelled form cannot roll them back
+                self.commit_pending()
+            with PROFILER.span("click.duplicate_check"):
+                duplicate = self.find_duplicate(geometry)
+            if duplicate is not None:
+                PROFILER.count("click.duplicate")
+                self.edit_existing(duplicate, quick)
+                return
+
             # Create feature
             feature = QgsFeature()
             feature.setGeometry(geometry)
             
             # Generate tile ID
-            tile_id = f"{raster_name}_{int(point.x())}_{int(point.y())}_{datetime.now().strftime('%H%M%S')}"
+            # the uuid suffix keeps ids unique for clicks in the same second, which
+            # truncated coordinates alone do not (e.g. in a geographic CRS)
+            tile_id = (f"{raster_name}_{int(point.x())}_{int(point.y())}_"
+                       f"{datetime.now().strftime('%H%M%S')}_{uuid.uuid4().hex[:8]}")
 
             fid_idx = self.habitat_layer.fields().indexFromName('fid')
 
@@ -399,14 +874,22 @@ class HabTile(QgsMapTool):
                     feature.setAttribute(idx, value)
             
 
+            if is_ctrl_click and self.last_habitat_main_1 and self.rapid_mode:
+                # Quick add into the open edit buffer, committed in batches
+                with PROFILER.span("click.rapid_add"):
+                    self.rapid_add(feature)
+                return
+
                 # Start editing
             self.habitat_layer.startEditing()
 
             if is_ctrl_click and self.last_habitat_main_1:
                 # Quick add using last values without showing form
                 self.habitat_layer.addFeature(feature)
-                self.habitat_layer.commitChanges()
-                self.canvas.refresh()
+                with PROFILER.span("click.commit"):
+                    self.habitat_layer.commitChanges()
+                with PROFILER.span("click.refresh"):
+                    self.canvas.refresh()
             else:
                 # Add feature and show form
                 self.habitat_layer.addFeature(feature)
@@ -434,7 +917,8 @@ class HabTile(QgsMapTool):
                         continue
                     # Hide all other fields
                     self.habitat_layer.setEditorWidgetSetup(idx, QgsEditorWidgetSetup("Hidden", {}))
-                dialog = iface.getFeatureForm(self.habitat_layer, feature)
+                with PROFILER.span("click.feature_form"):
+                    dialog = iface.getFeatureForm(self.habitat_layer, feature)
 
                 # Add a label showing the layer name at the top of the dialog
                 from qgis.PyQt.QtWidgets import QLabel, QVBoxLayout
@@ -455,26 +939,7 @@ class HabTile(QgsMapTool):
                     self.last_habitat_main_4 = saved_feature["habitat_4"]
                     if (self.box_size_pixel != saved_feature["box_size_pixel"]):
                         self.box_size_pixel = saved_feature["box_size_pixel"]
-                        # Calculate 256x256 pixel box size in raster units
-                        box_size_m = self.box_size_pixel * pixel_size
-                        half_box = box_size_m / 2
-                        
-                        # Create rectangle geometry in raster CRS
-                        rect = QgsRectangle(
-                            transformed_point.x() - half_box,
-                            transformed_point.y() - half_box,
-                            transformed_point.x() + half_box,
-                            transformed_point.y() + half_box
-                        )
-                        geometry = QgsGeometry.fromRect(rect)
-                        
-                        # Transform geometry back to map CRS
-                        transform_back = QgsCoordinateTransform(
-                            raster_crs,
-                            self.canvas.mapSettings().destinationCrs(),
-                            QgsProject.instance()
-                        )
-                        geometry.transform(transform_back)
+                        geometry, box_size_m = self.tile_geometry(transformed_point, pixel_size, raster_crs)
                         saved_feature.setGeometry(geometry)
                             # Update the feature in the layer
                         self.habitat_layer.startEditing()
@@ -485,12 +950,13 @@ class HabTile(QgsMapTool):
                     #     self.configure_attribute_form()  # Refresh the form configuration
                     
                     
-                    self.habitat_layer.commitChanges()
-                    self.canvas.refresh()
+                    with PROFILER.span("click.commit"):
+                        self.habitat_layer.commitChanges()
+                    with PROFILER.span("click.refresh"):
+                        self.canvas.refresh()
                     if self.habitat_layer.providerType() == "memory" and self.habitat_layer.featureCount() !=0:
                         def save_layer():
                             self.save_scratch_layer_with_dialog(self.habitat_layer)
-                            self.habitat_layer_saved = True
                         QTimer.singleShot(0, save_layer)
                 else:
                     # Form was cancelled, roll back the changes
@@ -509,6 +975,7 @@ class HabitatClassificationPlugin:
         self.tool = None
         self.selected_habitat_layer = None  # Store selected layer if tool not yet created
         self.toolbar_button = None
+        self.export_task = None  # running ExportTask, see run_export
 
     def initGui(self):
         """Create action(s) and add to toolbar/menu"""
@@ -522,6 +989,24 @@ class HabitatClassificationPlugin:
         self.select_layer_action.triggered.connect(self.select_habitat_layer)
         self.iface.addPluginToMenu(self.menu, self.select_layer_action)
         self.actions.append(self.select_layer_action)
+        self.rapid_action = QAction("Rapid Annotation Mode", self.iface.mainWindow())
+        self.rapid_action.setCheckable(True)
+        self.rapid_action.setToolTip("Ctrl+click tiles are committed in batches instead of one by one")
+        self.rapid_action.toggled.connect(self.set_rapid_mode)
+        self.iface.addPluginToMenu(self.menu, self.rapid_action)
+        self.actions.append(self.rapid_action)
+        self.export_action = QAction("Export to YOLO", self.iface.mainWindow())
+        self.export_action.setToolTip("Export the habitat tiles to a YOLO dataset in the background")
+        self.export_action.triggered.connect(self.run_export)
+        self.iface.addPluginToMenu(self.menu, self.export_action)
+        self.actions.append(self.export_action)
+        self.profile_action = QAction("Profile HabTile", self.iface.mainWindow())
+        self.profile_action.setCheckable(True)
+        self.profile_action.setChecked(PROFILER.enabled)
+        self.profile_action.setToolTip("Time clicks and exports; the profile is logged when switched off")
+        self.profile_action.toggled.connect(self.set_profiling)
+        self.iface.addPluginToMenu(self.menu, self.profile_action)
+        self.actions.append(self.profile_action)
 
 
         # Add the QAction to QGIS toolbar and menu (keeps expected behaviour)
@@ -559,6 +1044,11 @@ class HabitatClassificationPlugin:
                 canvas.unsetMapTool(self.tool)
         except Exception:
             pass
+        if self.export_task is not None:
+            self.export_task.cancel()
+        if self.tool:
+            self.tool.commit_pending()
+            self.tool.disconnect_signals()
 
         # Remove actions from menu and toolbar
         for action in list(self.actions):
@@ -596,6 +1086,27 @@ class HabitatClassificationPlugin:
         #           self.iface.removeDockWidget(self.dock)
         #           self.dock = None
 
+    def set_rapid_mode(self, enabled):
+        if self.tool:
+            self.tool.rapid_mode = enabled
+            if not enabled:
+                self.tool.commit_pending()
+
+    def set_profiling(self, enabled):
+        """Start a new profile, or log and save the current one"""
+        if enabled:
+            PROFILER.reset()
+            PROFILER.enabled = True
+            return
+        PROFILER.enabled = False
+        PROFILER.log()
+        home = QgsProject.instance().homePath()
+        if home and os.access(home, os.W_OK):
+            stem = os.path.join(home, f"habtile_profile_{datetime.now().strftime('%Y%m%d_%H%M%S')}")
+            PROFILER.dump_json(stem + ".json")
+            PROFILER.dump_csv(stem + ".csv")
+            log_debug(f"Profile saved to {stem}.json and {stem}.csv")
+
     def select_habitat_layer(self):
         dlg = HabitatLayerSelector()
         if dlg.exec_() == QDialog.Accepted:
@@ -628,24 +1139,35 @@ class HabitatClassificationPlugin:
         )
         
         if output_dir:
-            try:
-                self.tool.export_to_yolo(output_dir)
-                QMessageBox.information(
-                    None,
-                    "Export Complete",
-                    f"Dataset exported successfully to:\n{output_dir}"
-                )
-            except Exception as e:
-                QMessageBox.critical(
-                    None,
-                    "Export Error",
-                    f"Failed to export dataset:\n{str(e)}"
-                )
+            if self.export_task is not None:
+                QMessageBox.warning(None, "Export Running", "An export is already running.")
+                return
+            self.tool.commit_pending()
+            self.export_task = ExportTask(self.tool.habitat_layer, output_dir, self.export_finished)
+            QgsApplication.taskManager().addTask(self.export_task)
+
+    def export_finished(self, ok, task):
+        self.export_task = None
+        if ok:
+            QMessageBox.information(
+                None,
+                "Export Complete",
+                f"Dataset exported successfully to:\n{task.output_dir}"
+            )
+        elif task.error is not None:
+            QMessageBox.critical(
+                None,
+                "Export Error",
+                f"Failed to export dataset:\n{str(task.error)}"
+            )
+        else:
+            log_debug(f"Export to {task.output_dir} canceled")
     
     def run(self):
         """Run the tool"""
         if not self.tool:
             self.tool = HabTile(self.iface.mapCanvas(), self.selected_habitat_layer)
+            self.tool.rapid_mode = self.rapid_action.isChecked()
             if self.tool.habitat_layer:
                 self.tool.set_symbology()
                 self.tool.configure_attribute_form()
@@ -667,6 +1189,15 @@ from qgis.core import (
     QgsProcessingAlgorithm,
     QgsProcessingParameterVectorLayer,
     QgsProcessingParameterFolderDestination,
+    QgsProcessingParameterFile,
+    QgsProcessingParameterNumber,
+    QgsProcessingParameterEnum,
+    QgsProcessingParameterBoolean,
+    QgsProcessingParameterRasterLayer,
+    QgsProcessingParameterFeatureSource,
+    QgsProcessingParameterFileDestination,
+    QgsProcessingOutputNumber,
+    QgsProcessing,
     QgsProcessingException,
     QgsApplication,
     QgsProcessingContext,
@@ -676,6 +1207,19 @@ from qgis.core import (
 class ExportToYoloAlgorithm(QgsProcessingAlgorithm):
     INPUT = 'INPUT'
     OUTPUT_DIR = 'OUTPUT_DIR'
+    RASTER_DIR = 'RASTER_DIR'
+    WORKERS = 'WORKERS'
+    TILE_ORDER = 'TILE_ORDER'
+    TILE_ORDERS = ['hilbert', 'zorder', 'block', 'fid']
+    LABEL_FORMAT = 'LABEL_FORMAT'
+    SYNC = 'SYNC'
+    OUTPUT_FORMAT = 'OUTPUT_FORMAT'
+    SHARD_SIZE = 'SHARD_SIZE'
+    MIN_VALID = 'MIN_VALID'
+    VAL_PERCENT = 'VAL_PERCENT'
+    TEST_PERCENT = 'TEST_PERCENT'
+    SPLIT_BLOCK = 'SPLIT_BLOCK'
+    REPORT = 'REPORT'
 
     def __init__(self, provider=None):
         super().__init__()
@@ -695,7 +1239,9 @@ class ExportToYoloAlgorithm(QgsProcessingAlgorithm):
         return 'habtile'
 
     def shortHelpString(self):
-        return 'Export habitat layer features and tiles to a YOLO-style dataset directory.'
+        return ('Export habitat layer features and tiles to a YOLO-style dataset directory. '
+                'Set a validation and/or test percentage to split the tiles by spatial blocks, '
+                'stratified by class, into images/train, images/val and images/test with a data.yaml.')
 
     def initAlgorithm(self, config=None):
         # optional input layer (if not provided algorithm will try to use the plugin layer)
@@ -712,6 +1258,114 @@ class ExportToYoloAlgorithm(QgsProcessingAlgorithm):
                 'Output directory'
             )
         )
+        # rasters that are not loaded in the project are looked up here by name
+        self.addParameter(
+            QgsProcessingParameterFile(
+                self.RASTER_DIR,
+                'Raster search directory (optional)',
+                behavior=QgsProcessingParameterFile.Folder,
+                optional=True
+            )
+        )
+        self.addParameter(
+            QgsProcessingParameterNumber(
+                self.WORKERS,
+                'Parallel tile workers',
+                type=QgsProcessingParameterNumber.Integer,
+                defaultValue=1,
+                minValue=1
+            )
+        )
+        self.addParameter(
+            QgsProcessingParameterEnum(
+                self.TILE_ORDER,
+                'Tile read order within each raster',
+                options=['Hilbert curve', 'Z-order curve', 'Raster block rows', 'Feature id'],
+                defaultValue=0
+            )
+        )
+        self.addParameter(
+            QgsProcessingParameterEnum(
+                self.LABEL_FORMAT,
+                'Label output',
+                options=['Text file per tile', 'Single labels.jsonl shard'],
+                defaultValue=0
+            )
+        )
+        self.addParameter(
+            QgsProcessingParameterBoolean(
+                self.SYNC,
+                'Sync labels to disk (fsync)',
+                defaultValue=False
+            )
+        )
+        self.addParameter(
+            QgsProcessingParameterEnum(
+                self.OUTPUT_FORMAT,
+                'Output format',
+                options=[
+                    'Image and label files',
+                    'Tar shards (image + label + json per sample)',
+                    'Memory-mapped NumPy chip store'
+                ],
+                defaultValue=0
+            )
+        )
+        self.addParameter(
+            QgsProcessingParameterNumber(
+                self.SHARD_SIZE,
+                'Maximum tar shard size (MB)',
+                type=QgsProcessingParameterNumber.Integer,
+                defaultValue=1024,
+                minValue=1
+            )
+        )
+        self.addParameter(
+            QgsProcessingParameterNumber(
+                self.MIN_VALID,
+                'Skip tiles with less valid (not nodata) pixels than (%)',
+                type=QgsProcessingParameterNumber.Double,
+                defaultValue=0.0,
+                minValue=0.0,
+                maxValue=100.0
+            )
+        )
+        self.addParameter(
+            QgsProcessingParameterNumber(
+                self.VAL_PERCENT,
+                'Validation split (%)',
+                type=QgsProcessingParameterNumber.Double,
+                defaultValue=0.0,
+                minValue=0.0,
+                maxValue=100.0
+            )
+        )
+        self.addParameter(
+            QgsProcessingParameterNumber(
+                self.TEST_PERCENT,
+                'Test split (%)',
+                type=QgsProcessingParameterNumber.Double,
+                defaultValue=0.0,
+                minValue=0.0,
+                maxValue=100.0
+            )
+        )
+        self.addParameter(
+            QgsProcessingParameterNumber(
+                self.SPLIT_BLOCK,
+                'Split block size in layer units (0 for ten tile widths)',
+                type=QgsProcessingParameterNumber.Double,
+                defaultValue=0.0,
+                minValue=0.0
+            )
+        )
+        self.addParameter(
+            QgsProcessingParameterBoolean(
+                self.REPORT,
+                'Write a throughput report (export_report.json)',
+                defaultValue=False
+            )
+        )
 
     def createInstance(self):
         # create a new instance with the same provider
@@ -724,22 +1378,581 @@ class ExportToYoloAlgorithm(QgsProcessingAlgorithm):
     def processAlgorithm(self, parameters, context: QgsProcessingContext, feedback: QgsProcessingFeedback):
         layer = self.parameterAsVectorLayer(parameters, self.INPUT, context)
         out_dir = self.parameterAsString(parameters, self.OUTPUT_DIR, context)
+        raster_dir = self.parameterAsFile(parameters, self.RASTER_DIR, context)
+        workers = self.parameterAsInt(parameters, self.WORKERS, context)
+        tile_order = self.TILE_ORDERS[self.parameterAsEnum(parameters, self.TILE_ORDER, context)]
+        label_format = LabelWriter.FORMATS[self.parameterAsEnum(parameters, self.LABEL_FORMAT, context)]
+        sync = self.parameterAsBoolean(parameters, self.SYNC, context)
+        output_format = OUTPUT_FORMATS[self.parameterAsEnum(parameters, self.OUTPUT_FORMAT, context)]
+        shard_bytes = self.parameterAsInt(parameters, self.SHARD_SIZE, context) * 1024 * 1024
+        min_valid = self.parameterAsDouble(parameters, self.MIN_VALID, context) / 100.0
+        val = self.parameterAsDouble(parameters, self.VAL_PERCENT, context)
+        test = self.parameterAsDouble(parameters, self.TEST_PERCENT, context)
+        split_block = self.parameterAsDouble(parameters, self.SPLIT_BLOCK, context)
+        if val + test >= 100:
+            raise QgsProcessingException('Validation and test splits must leave some tiles for training.')
+        split = (100 - val - test, val, test) if val or test else None
+        write_report = self.parameterAsBoolean(parameters, self.REPORT, context)
         if layer is None:
             raise QgsProcessingException('No habitat layer provided.')
-        # You may want to get habitat_types from the plugin or from the layer
-        # For now, try to get from plugin if available, else from unique values
-        habitat_types = []
-        prov = self.provider()
-        if prov and getattr(prov, 'plugin', None) and getattr(prov.plugin, 'tool', None):
-            habitat_types = prov.plugin.tool.habitat_types
-        else:
-            # fallback: get unique values from the layer
-            idx = layer.fields().indexFromName("habitat_1")
-            if idx >= 0:
-                habitat_types = list(sorted(set([f["habitat_1"] for f in layer.getFeatures()])))
-        export_to_yolo(layer, out_dir)
+        # class names are derived from the layer by export_to_yolo in its single scan
+        export_to_yolo(layer, out_dir, [raster_dir] if raster_dir else None, workers=workers,
+                       tile_order=tile_order, label_format=label_format, sync=sync,
+                       output_format=output_format, shard_bytes=shard_bytes,
+                       min_valid_fraction=min_valid, split=split, split_block_size=split_block or None,
+                       feedback=feedback, write_report=write_report)
         return {'OUTPUT': out_dir}
 
+def valid_fractions(source, rects, tile_size_pixel):
+    """Valid-pixel fraction of each QgsRectangle (in the raster CRS) of a raster"""
+    from .habtile_tiles import ValidPixelScreen
+    try:
+        screen = ValidPixelScreen(source, tile_size_pixel)
+    except IOError as e:
+        raise QgsProcessingException(str(e))
+    windows = [
+        screen.window_for_bounds(r.xMinimum(), r.yMinimum(), r.xMaximum(), r.yMaximum()) for r in rects
+    ]
+    return screen.fractions(windows)
+
+def tile_grid(extent, pixel_x, pixel_y, box_size_pixel, stride_pixel):
+    """Yield (x_offset, y_offset, QgsRectangle) of a tile grid over extent
+
+    Tiles are box_size_pixel pixels square, start at the top left corner of
+    extent (so they stay on the raster's pixel grid when extent is the
+    raster extent) and step stride_pixel pixels. The offsets are the tile's
+    top left pixel, counted from the top left corner of extent. Only whole
+    tiles inside extent are produced.
+    """
+    width = box_size_pixel * pixel_x
+    height = box_size_pixel * pixel_y
+    step_x = stride_pixel * pixel_x
+    step_y = stride_pixel * pixel_y
+    cols = int((extent.width() - width) // step_x) + 1 if extent.width() >= width else 0
+    rows = int((extent.height() - height) // step_y) + 1 if extent.height() >= height else 0
+    for row in range(rows):
+        y_max = extent.yMaximum() - row * step_y
+        for col in range(cols):
+            x_min = extent.xMinimum() + col * step_x
+            yield col * stride_pixel, row * stride_pixel, QgsRectangle(x_min, y_max - height, x_min + width, y_max)
+
+class CreateTileGridAlgorithm(QgsProcessingAlgorithm):
+    """Seed a habitat layer with a regular grid of unlabelled tiles"""
+    RASTER = 'RASTER'
+    HABITAT_LAYER = 'HABITAT_LAYER'
+    AOI = 'AOI'
+    BOX_SIZE_PIXEL = 'BOX_SIZE_PIXEL'
+    OVERLAP = 'OVERLAP'
+    SKIP_NODATA = 'SKIP_NODATA'
+    MIN_VALID = 'MIN_VALID'
+    TILE_COUNT = 'TILE_COUNT'
+
+    def __init__(self, provider=None):
+        super().__init__()
+        self._provider = provider
+
+    def name(self):
+        return 'create_tile_grid'
+
+    def displayName(self):
+        return 'Create habitat tile grid'
+
+    def group(self):
+        return 'HabTile'
+
+    def groupId(self):
+        return 'habtile'
+
+    def shortHelpString(self):
+        return ('Add a grid of box_size_pixel tiles over a raster, or the part of it inside an '
+                'area of interest, to a habitat layer in one bulk insert. Tiles can overlap '
+                'and tiles with less than a minimum share of valid (not nodata) pixels, '
+                'estimated from the raster overviews, can be skipped.')
+
+    def flags(self):
+        # the tiles are added to a project layer, which must happen on the main thread
+        return super().flags() | QgsProcessingAlgorithm.FlagNoThreading
+
+    def initAlgorithm(self, config=None):
+        self.addParameter(
+            QgsProcessingParameterRasterLayer(
+                self.RASTER,
+                'Source raster'
+            )
+        )
+        self.addParameter(
+            QgsProcessingParameterVectorLayer(
+                self.HABITAT_LAYER,
+                'Habitat layer to add tiles to',
+                [QgsProcessing.TypeVectorPolygon]
+            )
+        )
+        self.addParameter(
+            QgsProcessingParameterFeatureSource(
+                self.AOI,
+                'Area of interest (optional)',
+                [QgsProcessing.TypeVectorPolygon],
+                optional=True
+            )
+        )
+        self.addParameter(
+            QgsProcessingParameterNumber(
+                self.BOX_SIZE_PIXEL,
+                'Tile size (pixels)',
+                type=QgsProcessingParameterNumber.Integer,
+                defaultValue=256,
+                minValue=1
+            )
+        )
+        self.addParameter(
+            QgsProcessingParameterNumber(
+                self.OVERLAP,
+                'Overlap between neighbouring tiles (%)',
+                type=QgsProcessingParameterNumber.Double,
+                defaultValue=0.0,
+                minValue=0.0,
+                maxValue=90.0
+            )
+        )
+        self.addParameter(
+            QgsProcessingParameterBoolean(
+                self.SKIP_NODATA,
+                'Skip tiles that are mostly nodata',
+                defaultValue=True
+            )
+        )
+        self.addParameter(
+            QgsProcessingParameterNumber(
+                self.MIN_VALID,
+                'Minimum valid pixels per tile (%)',
+                type=QgsProcessingParameterNumber.Double,
+                defaultValue=1.0,
+                minValue=0.0,
+                maxValue=100.0
+            )
+        )
+        self.addOutput(QgsProcessingOutputNumber(self.TILE_COUNT, 'Number of tiles created'))
+
+    def createInstance(self):
+        return CreateTileGridAlgorithm(self._provider)
+
+    def provider(self):
+        return self._provider
+
+    def processAlgorithm(self, parameters, context: QgsProcessingContext, feedback: QgsProcessingFeedback):
+        raster = self.parameterAsRasterLayer(parameters, self.RASTER, context)
+        layer = self.parameterAsVectorLayer(parameters, self.HABITAT_LAYER, context)
+        aoi_source = self.parameterAsSource(parameters, self.AOI, context)
+        box_size_pixel = self.parameterAsInt(parameters, self.BOX_SIZE_PIXEL, context)
+        overlap = self.parameterAsDouble(parameters, self.OVERLAP, context)
+        skip_nodata = self.parameterAsBoolean(parameters, self.SKIP_NODATA, context)
+        min_valid = self.parameterAsDouble(parameters, self.MIN_VALID, context) / 100.0
+        if raster is None or layer is None:
+            raise QgsProcessingException('A raster and a habitat layer are required.')
+        missing = [name for name, _, _ in HABITAT_LAYER_FIELDS if name not in layer.fields().names()]
+        if missing:
+            raise QgsProcessingException(f"Habitat layer is missing fields: {', '.join(missing)}")
+
+        pixel_x = raster.rasterUnitsPerPixelX()
+        pixel_y = raster.rasterUnitsPerPixelY()
+        stride_pixel = max(1, int(round(box_size_pixel * (1.0 - overlap / 100.0))))
+        extent = raster.extent()
+        # pixel offset of the grid origin in the raster, for unique tile ids
+        origin_col = origin_row = 0
+        aoi_engine = None
+        if aoi_source is not None:
+            aoi_geom = QgsGeometry.unaryUnion([f.geometry() for f in aoi_source.getFeatures()])
+            if aoi_source.sourceCrs() != raster.crs():
+                aoi_geom.transform(QgsCoordinateTransform(aoi_source.sourceCrs(), raster.crs(), context.transformContext()))
+            if aoi_geom.isEmpty():
+                raise QgsProcessingException('The area of interest is empty.')
+            aoi_box = aoi_geom.boundingBox().intersect(extent)
+            if aoi_box.isEmpty():
+                raise QgsProcessingException('The area of interest does not overlap the raster.')
+            # snap the AOI bounds outwards onto the raster's pixel grid
+            origin_col = math.floor((aoi_box.xMinimum() - extent.xMinimum()) / pixel_x)
+            origin_row = math.floor((extent.yMaximum() - aoi_box.yMaximum()) / pixel_y)
+            extent = QgsRectangle(
+                extent.xMinimum() + origin_col * pixel_x,
+                aoi_box.yMinimum() - box_size_pixel * pixel_y,
+                aoi_box.xMaximum() + box_size_pixel * pixel_x,
+                extent.yMaximum() - origin_row * pixel_y
+            ).intersect(raster.extent())
+            aoi_engine = QgsGeometry.createGeometryEngine(aoi_geom.constGet())
+            aoi_engine.prepareGeometry()
+
+        to_layer = None
+        if layer.crs() != raster.crs():
+            to_layer = QgsCoordinateTransform(raster.crs(), layer.crs(), context.transformContext())
+
+        cells = list(tile_grid(extent, pixel_x, pixel_y, box_size_pixel, stride_pixel))
+        rects = [rect for _, _, rect in cells]
+        feedback.pushInfo(f"Checking {len(rects)} grid cells")
+        fractions = None
+        if skip_nodata and rects:
+            fractions = valid_fractions(raster.source(), rects, box_size_pixel)
+        fields = layer.fields()
+        features = []
+        skipped = 0
+        for i, (x_offset, y_offset, rect) in enumerate(cells):
+            if feedback.isCanceled():
+                break
+            if i % 1000 == 0:
+                feedback.setProgress(90.0 * i / max(len(rects), 1))
+            geometry = QgsGeometry.fromRect(rect)
+            if aoi_engine is not None and not aoi_engine.intersects(geometry.constGet()):
+                continue
+            if fractions is not None and fractions[i] < min_valid:
+                skipped += 1
+                continue
+            center = rect.center()
+            if to_layer is not None:
+                geometry.transform(to_layer)
+                center = to_layer.transform(center)
+            feature = QgsFeature(fields)
+            feature.setGeometry(geometry)
+            attrs = {
+                "notes": "",
+                "source_raster": raster.name(),
+                "pixel_size": pixel_x,
+                "tile_id": f"{raster.name()}_{origin_col + x_offset}_{origin_row + y_offset}_grid",
+                "box_size_m": box_size_pixel * pixel_x,
+                "box_size_pixel": box_size_pixel,
+                "center_x": center.x(),
+                "center_y": center.y(),
+            }
+            for field_name, value in attrs.items():
+                feature.setAttribute(fields.indexFromName(field_name), value)
+            features.append(feature)
+        if feedback.isCanceled():
+            return {self.HABITAT_LAYER: layer.id(), self.TILE_COUNT: 0}
+        if skipped:
+            feedback.pushInfo(f"Skipped {skipped} nodata tiles")
+
+        # one provider call, so file based layers insert all tiles in a single transaction
+        feedback.pushInfo(f"Adding {len(features)} tiles to {layer.name()}")
+        ok, _ = layer.dataProvider().addFeatures(features)
+        if not ok:
+            raise QgsProcessingException(
+                f"Could not add tiles: {'; '.join(layer.dataProvider().errors())}"
+            )
+        layer.updateExtents()
+        # reload emits dataChanged, so cached tile indexes see the provider write
+        layer.reload()
+        feedback.setProgress(100)
+        return {self.HABITAT_LAYER: layer.id(), self.TILE_COUNT: len(features)}
+
+class DeduplicateTilesAlgorithm(QgsProcessingAlgorithm):
+    """Flag or remove tiles that duplicate another tile of the same raster"""
+    INPUT = 'INPUT'
+    MIN_IOU = 'MIN_IOU'
+    ACTION = 'ACTION'
+    DUPLICATE_COUNT = 'DUPLICATE_COUNT'
+    ACTIONS = ['flag', 'remove']
+    FLAG_FIELD = 'duplicate_of'
+
+    def __init__(self, provider=None):
+        super().__init__()
+        self._provider = provider
+
+    def name(self):
+        return 'deduplicate_tiles'
+
+    def displayName(self):
+        return 'Deduplicate habitat tiles'
+
+    def group(self):
+        return 'HabTile'
+
+    def groupId(self):
+        return 'habtile'
+
+    def shortHelpString(self):
+        return ('Find tiles that overlap another tile of the same source raster with an '
+                'intersection over union at or above the threshold. Labelled tiles and then '
+                'older tiles (lower feature id) are kept; the others are either flagged in a '
+                f'"{self.FLAG_FIELD}" field with the id of the tile they duplicate, or deleted.')
+
+    def flags(self):
+        # the input project layer is edited in place (fields, flags or deletes) on the main thread
+        return super().flags() | QgsProcessingAlgorithm.FlagNoThreading
+
+    def initAlgorithm(self, config=None):
+        self.addParameter(
+            QgsProcessingParameterVectorLayer(
+                self.INPUT,
+                'Habitat layer',
+                [QgsProcessing.TypeVectorPolygon]
+            )
+        )
+        self.addParameter(
+            QgsProcessingParameterNumber(
+                self.MIN_IOU,
+                'Minimum intersection over union',
+                type=QgsProcessingParameterNumber.Double,
+                defaultValue=0.5,
+                minValue=0.01,
+                maxValue=1.0
+            )
+        )
+        self.addParameter(
+            QgsProcessingParameterEnum(
+                self.ACTION,
+                'Duplicates',
+                options=['Flag them', 'Delete them'],
+                defaultValue=0
+            )
+        )
+        self.addOutput(QgsProcessingOutputNumber(self.DUPLICATE_COUNT, 'Number of duplicate tiles'))
+
+    def createInstance(self):
+        return DeduplicateTilesAlgorithm(self._provider)
+
+    def provider(self):
+        return self._provider
+
+    def processAlgorithm(self, parameters, context: QgsProcessingContext, feedback: QgsProcessingFeedback):
+        layer = self.parameterAsVectorLayer(parameters, self.INPUT, context)
+        min_iou = self.parameterAsDouble(parameters, self.MIN_IOU, context)
+        action = self.ACTIONS[self.parameterAsEnum(parameters, self.ACTION, context)]
+        if layer is None:
+            raise QgsProcessingException('No habitat layer provided.')
+        if 'source_raster' not in layer.fields().names():
+            raise QgsProcessingException('Habitat layer has no source_raster field.')
+
+        # one read of the geometries and the two attributes that matter
+        labelled_field = 'habitat_1' if 'habitat_1' in layer.fields().names() else None
+        request = QgsFeatureRequest().setSubsetOfAttributes(
+            ['source_raster'] + ([labelled_field] if labelled_field else []), layer.fields()
+        )
+        tiles = []
+        for feature in layer.getFeatures(request):
+            if feature.hasGeometry():
+                labelled = bool(labelled_field and feature[labelled_field])
+                tiles.append((not labelled, feature.id(), feature['source_raster'] or '', feature.geometry()))
+        if feedback.isCanceled():
+            return {self.DUPLICATE_COUNT: 0}
+        tiles.sort(key=lambda tile: (tile[0], tile[1]))
+        feedback.pushInfo(f"Checking {len(tiles)} tiles")
+
+        # greedy pass: each tile is compared only with the kept tiles of its
+        # raster that its bounding box touches
+        indexes = {}
+        kept = {}
+        duplicates = {}
+        for i, (_, fid, raster, geometry) in enumerate(tiles):
+            if feedback.isCanceled():
+                return {self.DUPLICATE_COUNT: 0}
+            if i % 1000 == 0:
+                feedback.setProgress(80.0 * i / max(len(tiles), 1))
+            index = indexes.get(raster)
+            if index is None:
+                index = indexes[raster] = QgsSpatialIndex()
+            best_fid, best_iou = None, min_iou
+            for other in index.intersects(geometry.boundingBox()):
+                iou = box_iou(geometry, kept[other])
+                if iou >= best_iou:
+                    best_fid, best_iou = other, iou
+            if best_fid is None:
+                index.addFeature(fid, geometry.boundingBox())
+                kept[fid] = geometry
+            else:
+                duplicates[fid] = best_fid
+        feedback.pushInfo(f"Found {len(duplicates)} duplicate tiles")
+
+        provider = layer.dataProvider()
+        if action == 'remove':
+            ok = provider.deleteFeatures(list(duplicates)) if duplicates else True
+        else:
+            if self.FLAG_FIELD not in layer.fields().names():
+                provider.addAttributes([QgsField(self.FLAG_FIELD, QVariant.LongLong)])
+                layer.updateFields()
+            field_idx = layer.fields().indexFromName(self.FLAG_FIELD)
+            # reset earlier flags so tiles that are no longer duplicates are cleared
+            request = QgsFeatureRequest().setSubsetOfAttributes([self.FLAG_FIELD], layer.fields())
+            request.setFlags(QgsFeatureRequest.NoGeometry)
+            changes = {
+                feature.id(): {field_idx: None}
+                for feature in layer.getFeatures(request) if feature[self.FLAG_FIELD]
+            }
+            for fid, original in duplicates.items():
+                changes[fid] = {field_idx: original}
+            ok = provider.changeAttributeValues(changes) if changes else True
+        if not ok:
+            raise QgsProcessingException(f"Could not update tiles: {'; '.join(provider.errors())}")
+        # reload emits dataChanged, so cached tile indexes see the provider write
+        layer.reload()
+        feedback.setProgress(100)
+        return {self.DUPLICATE_COUNT: len(duplicates)}
+
+def read_columns(layer, names):
+    """Read attribute columns of layer into lists in one pass, without geometries
+
+    Columns the layer lacks are filled with None.
+    """
+    fields = layer.fields()
+    present = [name for name in names if name in fields.names()]
+    request = QgsFeatureRequest().setSubsetOfAttributes(present, fields)
+    request.setFlags(QgsFeatureRequest.NoGeometry)
+    indexes = [fields.indexFromName(name) for name in present]
+    columns = {name: [] for name in present}
+    for feature in layer.getFeatures(request):
+        attrs = feature.attributes()
+        for name, idx in zip(present, indexes):
+            columns[name].append(attrs[idx])
+    count = len(columns[present[0]]) if present else 0
+    for name in names:
+        columns.setdefault(name, [None] * count)
+    return columns
+
+def habitat_statistics(columns):
+    """Class, level, raster and co-occurrence statistics of read_columns output
+
+    Tiles are grouped by the unique rows of their habitat_1..4 codes, so
+    class names are built once per class rather than per tile; areas are
+    box_size_m squared.
+    """
+    import numpy as np
+    count = len(columns["source_raster"])
+    values = np.array([
+        str(value).strip() if value is not None else "NULL"
+        for name in HABITAT_FIELDS for value in columns[name]
+    ], dtype=str).reshape(len(HABITAT_FIELDS), count).T
+    vocab, codes = np.unique(values, return_inverse=True)
+    codes = codes.reshape(count, len(HABITAT_FIELDS))
+    area = np.array([
+        float(value) ** 2 if isinstance(value, (int, float)) else 0.0 for value in columns["box_size_m"]
+    ])
+
+    rows, class_of, class_counts = np.unique(codes, axis=0, return_inverse=True, return_counts=True)
+    class_of = class_of.reshape(-1)
+    class_area = np.bincount(class_of, weights=area, minlength=len(rows))
+    class_names = [habitat_string(vocab[row]) for row in rows]
+    order = np.argsort(-class_counts, kind="stable")
+
+    levels = {}
+    for i, name in enumerate(HABITAT_FIELDS):
+        level_counts = np.bincount(codes[:, i], minlength=len(vocab))
+        levels[name] = {str(vocab[c]): int(level_counts[c]) for c in np.flatnonzero(level_counts)}
+
+    rasters, raster_of = np.unique(
+        np.array([str(value) if value else "" for value in columns["source_raster"]], dtype=str),
+        return_inverse=True
+    )
+    raster_of = raster_of.reshape(-1)
+    raster_counts = np.bincount(raster_of, minlength=len(rasters))
+    raster_area = np.bincount(raster_of, weights=area, minlength=len(rasters))
+    raster_classes = np.bincount(
+        raster_of * len(rows) + class_of, minlength=len(rasters) * len(rows)
+    ).reshape(len(rasters), len(rows))
+
+    # co-occurrence of habitat values within a tile, NULLs left out
+    labelled = np.array(["NULL" not in value and value != "" for value in vocab], dtype=bool)
+    k = len(vocab)
+    tile_codes = np.sort(codes, axis=1)
+    valid = labelled[tile_codes]
+    valid[:, 1:] &= tile_codes[:, 1:] != tile_codes[:, :-1]
+    pairs = np.zeros(k * k, dtype=np.int64)
+    for i in range(len(HABITAT_FIELDS)):
+        for j in range(i, len(HABITAT_FIELDS)):
+            both = valid[:, i] & valid[:, j]
+            pairs += np.bincount(tile_codes[both, i] * k + tile_codes[both, j], minlength=k * k)
+    # sorted codes only fill the upper triangle and the diagonal
+    pairs = pairs.reshape(k, k)
+    cooccurrence = (pairs + np.triu(pairs, 1).T)[np.ix_(labelled, labelled)]
+
+    return {
+        "tiles": count,
+        "area": float(area.sum()),
+        "classes": [
+            {"name": class_names[c], "count": int(class_counts[c]), "area": float(class_area[c])}
+            for c in order
+        ],
+        "levels": levels,
+        "rasters": [
+            {
+                "name": str(rasters[r]), "count": int(raster_counts[r]), "area": float(raster_area[r]),
+                "classes": {class_names[c]: int(raster_classes[r, c]) for c in np.flatnonzero(raster_classes[r])}
+            }
+            for r in range(len(rasters))
+        ],
+        "cooccurrence": {
+            "values": [str(value) for value in vocab[labelled]],
+            "matrix": cooccurrence.tolist(),
+        },
+    }
+
+class ClassStatisticsAlgorithm(QgsProcessingAlgorithm):
+    """Per-class, per-raster and co-occurrence statistics of a habitat layer"""
+    INPUT = 'INPUT'
+    OUTPUT = 'OUTPUT'
+    TILE_COUNT = 'TILE_COUNT'
+    CLASS_COUNT = 'CLASS_COUNT'
+
+    def __init__(self, provider=None):
+        super().__init__()
+        self._provider = provider
+
+    def name(self):
+        return 'class_statistics'
+
+    def displayName(self):
+        return 'Habitat class statistics'
+
+    def group(self):
+        return 'HabTile'
+
+    def groupId(self):
+        return 'habtile'
+
+    def shortHelpString(self):
+        return ('Count tiles and total tile area per habitat class, per habitat_1..4 value and per '
+                'source raster, and how often habitat values occur together in a tile. Only the '
+                'habitat, source_raster and box_size_m columns are read. The report is written as JSON.')
+
+    def initAlgorithm(self, config=None):
+        self.addParameter(
+            QgsProcessingParameterVectorLayer(
+                self.INPUT,
+                'Habitat layer',
+                [QgsProcessing.TypeVectorPolygon]
+            )
+        )
+        self.addParameter(
+            QgsProcessingParameterFileDestination(
+                self.OUTPUT,
+                'Statistics report',
+                fileFilter='JSON files (*.json)'
+            )
+        )
+        self.addOutput(QgsProcessingOutputNumber(self.TILE_COUNT, 'Number of tiles'))
+        self.addOutput(QgsProcessingOutputNumber(self.CLASS_COUNT, 'Number of classes'))
+
+    def createInstance(self):
+        return ClassStatisticsAlgorithm(self._provider)
+
+    def provider(self):
+        return self._provider
+
+    def processAlgorithm(self, parameters, context: QgsProcessingContext, feedback: QgsProcessingFeedback):
+        layer = self.parameterAsVectorLayer(parameters, self.INPUT, context)
+        output = self.parameterAsFileOutput(parameters, self.OUTPUT, context)
+        if layer is None:
+            raise QgsProcessingException('No habitat layer provided.')
+        columns = read_columns(layer, HABITAT_FIELDS + ["source_raster", "box_size_m"])
+        feedback.setProgress(50)
+        if feedback.isCanceled():
+            return {}
+        stats = habitat_statistics(columns)
+        with open(output, 'w') as f:
+            json.dump(stats, f, indent=1)
+        feedback.pushInfo(f"{stats['tiles']} tiles in {len(stats['classes'])} classes "
+                          f"over {len(stats['rasters'])} rasters")
+        for entry in stats["classes"][:20]:
+            feedback.pushInfo(f"  {entry['name'] or '(unlabelled)'}: {entry['count']} tiles, {entry['area']:.0f} m²")
+        feedback.setProgress(100)
+        return {self.OUTPUT: output, self.TILE_COUNT: stats['tiles'], self.CLASS_COUNT: len(stats['classes'])}
+
 class HabitatProcessingProvider(QgsProcessingProvider):
     def __init__(self, plugin):
         super().__init__()
@@ -754,99 +1967,1074 @@ class HabitatProcessingProvider(QgsProcessingProvider):
     def loadAlgorithms(self):
         log_debug("HabTile: Registering ExportToYoloAlgorithm")
         self.addAlgorithm(ExportToYoloAlgorithm(self))
+        self.addAlgorithm(CreateTileGridAlgorithm(self))
+        self.addAlgorithm(DeduplicateTilesAlgorithm(self))
+        self.addAlgorithm(ClassStatisticsAlgorithm(self))
 
     def longName(self):
         return self.name()
 
-def export_to_yolo(layer, output_dir):
-    """Export habitat classifications to YOLO format"""
-    import os, csv
-    if not output_dir:
-        raise ValueError("Output directory not specified")
-    if not layer or layer.featureCount() == 0:
-        raise ValueError("No habitat classifications to export")
-    images_dir = os.path.join(output_dir, "images")
-    labels_dir = os.path.join(output_dir, "labels")
-    metadata_dir = os.path.join(output_dir, "metadata")
-    os.makedirs(images_dir, exist_ok=True)
-    os.makedirs(labels_dir, exist_ok=True)
-    os.makedirs(metadata_dir, exist_ok=True)
-    class_file = os.path.join(output_dir, "classes.txt")
-    habitat_types = set()
-    # make habitat list from layer features
-    for feature in layer.getFeatures():
-        habitat_fields = ["habitat_1", "habitat_2", "habitat_3", "habitat_4"]
-        habs = filter(lambda x: 'NULL' not in x, [str(feature[field]).strip() for field in habitat_fields])
-        habitat_type = "; ".join(habs)
-        log_debug(f"Feature habitats: {habitat_type}")
-        if habitat_type:
-            habitat_types.add(habitat_type)
-        #need an index class_id = habitat_types.index(habitat_type)
-    habitat_types = sorted(habitat_types)  # sort for consistent order
-
-    for feature in layer.getFeatures():
-        habitat_fields = ["habitat_1", "habitat_2", "habitat_3", "habitat_4"]
-        habs = filter(lambda x: 'NULL' not in x, [str(feature[field]).strip() for field in habitat_fields])
-        habitat_type = "; ".join(habs)
-        
-        # if habitat_type is not in habitat_types: add it to the set
-        raster_name = feature["source_raster"]
-        tile_id = feature["tile_id"]
-        bbox = feature.geometry().boundingBox()
-        # Find the raster layer
-        raster_layer = None
-        from qgis.core import QgsMapLayer
-        for lyr in QgsProject.instance().mapLayers().values():
-            if lyr.type() == QgsMapLayer.RasterLayer and lyr.name() == raster_name:
-                raster_layer = lyr
-                break
-        if not raster_layer:
+RASTER_EXTENSIONS = ('.tif', '.tiff', '.vrt', '.img', '.jp2', '.ecw')
+
+class RasterInfo:
+    """Source, CRS, extent and geotransform of a raster used by the export"""
+
+    def __init__(self, name, source, crs, extent):
+        self.name = name
+        self.source = source
+        self.crs = crs
+        self.extent = extent
+        self._header = None
+
+    def _read_header(self):
+        """Read geotransform, pixel size and block size once from GDAL"""
+        if self._header is None:
+            from osgeo import gdal
+            self._header = {}
+            ds = gdal.Open(self.source)
+            if ds is not None:
+                self._header = {
+                    "geotransform": ds.GetGeoTransform(),
+                    "size": (ds.RasterXSize, ds.RasterYSize),
+                    "bands": ds.RasterCount,
+                    "block_size": tuple(ds.GetRasterBand(1).GetBlockSize()),
+                    "pixel_bytes": max(1, gdal.GetDataTypeSize(ds.GetRasterBand(1).DataType) // 8),
+                    "data_type": gdal.GetDataTypeName(ds.GetRasterBand(1).DataType),
+                }
+                ds = None
+        return self._header
+
+    @property
+    def geotransform(self):
+        """GDAL geotransform, read from the raster header on first use"""
+        return self._read_header().get("geotransform")
+
+    @property
+    def size(self):
+        """(width, height) of the raster in pixels"""
+        return self._read_header().get("size")
+
+    @property
+    def bands(self):
+        """Number of raster bands"""
+        return self._read_header().get("bands")
+
+    @property
+    def block_size(self):
+        """(width, height) of the raster's internal blocks"""
+        return self._read_header().get("block_size")
+
+    @property
+    def pixel_bytes(self):
+        """Bytes per pixel of one band"""
+        return self._read_header().get("pixel_bytes")
+
+    @property
+    def data_type(self):
+        """GDAL data type name of the first band, such as Byte or UInt16"""
+        return self._read_header().get("data_type")
+
+    @property
+    def mtime(self):
+        """Modification time of the raster file, or None if it is not a file"""
+        try:
+            return os.path.getmtime(self.source)
+        except OSError:
+            return None
+
+class RasterResolver:
+    """Resolve source_raster names to rasters once per export
+
+    Project raster layers are indexed by name when the resolver is built,
+    copying their source, CRS and extent, so a resolver built on the main
+    thread can be used from a background task. Names that are not loaded in
+    the project are looked up by file path: either the name is itself a
+    path, or a raster file with that name (minus extension) exists in one of
+    the search paths.
+    """
+
+    def __init__(self, search_paths=None, project=None):
+        project = project or QgsProject.instance()
+        self.search_paths = [p for p in (search_paths or []) if p]
+        self._layers = {}
+        for lyr in project.mapLayers().values():
+            if lyr.type() == QgsMapLayer.RasterLayer:
+                # first layer with a given name wins, as before
+                if lyr.name() not in self._layers:
+                    self._layers[lyr.name()] = (
+                        lyr.source(), QgsCoordinateReferenceSystem(lyr.crs()), QgsRectangle(lyr.extent())
+                    )
+        self._files = None
+        self._cache = {}
+
+    def _file_index(self):
+        """Map file stem -> path for rasters under the search paths"""
+        if self._files is None:
+            self._files = {}
+            for root_dir in self.search_paths:
+                for dirpath, _, filenames in os.walk(root_dir):
+                    for filename in sorted(filenames):
+                        stem, ext = os.path.splitext(filename)
+                        if ext.lower() in RASTER_EXTENSIONS:
+                            self._files.setdefault(stem, os.path.join(dirpath, filename))
+        return self._files
+
+    def _from_path(self, raster_name):
+        if os.path.isfile(raster_name):
+            path = raster_name
+        else:
+            path = self._file_index().get(raster_name)
+        if not path:
+            return None
+        from qgis.core import QgsRasterLayer
+        lyr = QgsRasterLayer(path, raster_name, "gdal")
+        if not lyr.isValid():
+            log_debug(f"Could not open raster {path}")
+            return None
+        return RasterInfo(raster_name, lyr.source(), lyr.crs(), lyr.extent())
+
+    def resolve(self, raster_name):
+        """Return RasterInfo for raster_name, or None if it cannot be found"""
+        if raster_name in self._cache:
+            return self._cache[raster_name]
+        info = None
+        layer_info = self._layers.get(raster_name)
+        if layer_info is not None:
+            info = RasterInfo(raster_name, *layer_info)
+        elif raster_name:
+            info = self._from_path(str(raster_name))
+        if info is None:
+            log_debug(f"Raster not found for export: {raster_name}")
+        self._cache[raster_name] = info
+        return info
+
+HABITAT_FIELDS = ["habitat_1", "habitat_2", "habitat_3", "habitat_4"]
+EXPORT_FIELDS = HABITAT_FIELDS + [
+    "source_raster", "tile_id", "pixel_size", "box_size_m", "box_size_pixel",
+    "center_x", "center_y", "confidence", "observer", "date_time", "notes"
+]
+METADATA_HEADER = [
+    'tile_id', 'habitat_type', 'confidence', 'source_raster',
+    'pixel_size', 'box_size_m', 'center_x', 'center_y',
+    'observer', 'date_time', 'notes'
+]
+
+def habitat_string(values):
+    """Join habitat_1..4 values into the combined class name, skipping NULLs"""
+    habs = filter(lambda x: 'NULL' not in x, [str(value).strip() for value in values])
+    return "; ".join(habs)
+
+class TileRecord:
+    """Lightweight copy of one habitat feature, collected in the export scan"""
+    __slots__ = (
+        'fid', 'tile_id', 'habitat_type', 'source_raster', 'bbox', 'metadata',
+        'geometry_hash', 'box_size_pixel'
+    )
+
+    def __init__(self, fid, tile_id, habitat_type, source_raster, bbox, metadata,
+                 geometry_hash=None, box_size_pixel=None):
+        self.fid = fid
+        self.tile_id = tile_id
+        self.habitat_type = habitat_type
+        self.source_raster = source_raster
+        self.bbox = bbox
+        self.metadata = metadata
+        self.geometry_hash = geometry_hash
+        self.box_size_pixel = box_size_pixel
+
+def scan_habitat_layer(layer):
+    """Read every habitat feature once and return a list of TileRecords
+
+    Only the attributes used by the export are fetched from the provider.
+    """
+    from qgis.core import QgsFeatureRequest
+    names = layer.fields().names()
+    present = [name for name in EXPORT_FIELDS if name in names]
+    request = QgsFeatureRequest().setSubsetOfAttributes(present, layer.fields())
+
+    def value(feature, name):
+        return feature[name] if name in names else ""
+
+    records = []
+    for feature in layer.getFeatures(request):
+        habitat_type = habitat_string(value(feature, field) for field in HABITAT_FIELDS)
+        date_time = value(feature, "date_time")
+        metadata = [
+            feature["tile_id"], habitat_type, value(feature, "confidence"),
+            feature["source_raster"], feature["pixel_size"], feature["box_size_m"],
+            feature["center_x"], feature["center_y"],
+            value(feature, "observer"),
+            date_time.toString() if hasattr(date_time, "toString") else date_time,
+            value(feature, "notes")
+        ]
+        geometry = feature.geometry()
+        box_size_pixel = value(feature, "box_size_pixel")
+        records.append(TileRecord(
+            feature.id(), feature["tile_id"], habitat_type, feature["source_raster"],
+            geometry.boundingBox(), metadata,
+            hashlib.sha1(bytes(geometry.asWkb())).hexdigest(),
+            int(box_size_pixel) if isinstance(box_size_pixel, (int, float)) and box_size_pixel > 0 else None
+        ))
+    return records
+
+class LayerSnapshot:
+    """The TileRecords and CRS of a habitat layer, read once on the main thread
+
+    export_to_yolo accepts one in place of the layer, so a background
+    export never touches the layer or the project (see ExportTask).
+    """
+    __slots__ = ('name', 'records', 'crs', 'transform_context')
+
+    def __init__(self, layer, transform_context=None):
+        self.name = layer.name()
+        self.records = scan_habitat_layer(layer)
+        self.crs = layer.crs()
+        self.transform_context = transform_context or QgsProject.instance().transformContext()
+
+class ExportManifest:
+    """Hashes and checksums of the tiles written by previous exports, keyed by tile_id"""
+    FILENAME = "manifest.json"
+    VERSION = 1
+
+    def __init__(self, output_dir, save_every=500, before_save=None):
+        self.output_dir = output_dir
+        self.path = os.path.join(output_dir, self.FILENAME)
+        # saved every save_every updates, so an interrupted export resumes where it stopped
+        self.save_every = save_every
+        # called before writing, e.g. to flush buffered labels the manifest refers to
+        self.before_save = before_save
+        self.tiles = {}
+        self._pending = 0
+        if os.path.exists(self.path):
+            try:
+                with open(self.path) as f:
+                    data = json.load(f)
+                if data.get("version") == self.VERSION:
+                    self.tiles = data.get("tiles", {})
+            except (OSError, ValueError) as e:
+                log_debug(f"Ignoring unreadable export manifest {self.path}: {e}")
+
+    @staticmethod
+    def attribute_hash(*values):
+        return hashlib.sha1(json.dumps([str(v) for v in values]).encode("utf-8")).hexdigest()
+
+    def image_current(self, tile_id, entry):
+        """True if the stored image for tile_id matches entry and still exists"""
+        old = self.tiles.get(tile_id)
+        if not old or not old.get("checksum"):
+            return False
+        for key in ("geometry", "source_raster", "raster_mtime"):
+            if old.get(key) != entry[key]:
+                return False
+        return os.path.exists(os.path.join(self.output_dir, old["image"]))
+
+    def label_current(self, tile_id, entry):
+        """True if the stored label for tile_id matches entry and still exists"""
+        old = self.tiles.get(tile_id)
+        if not old or old.get("attributes") != entry["attributes"]:
+            return False
+        if old.get("label") != entry.get("label"):
+            return False
+        # labels without a path live in the labels.jsonl shard, rewritten every export
+        return not old.get("label") or os.path.exists(os.path.join(self.output_dir, old["label"]))
+
+    def move_image(self, tile_id, image):
+        """Move the stored image of tile_id to image, e.g. into another split
+
+        Returns True if the image was moved, so it does not need cutting again.
+        """
+        old = self.tiles.get(tile_id)
+        if not old or not old.get("checksum") or old["image"] == image:
+            return False
+        old_path = os.path.join(self.output_dir, old["image"])
+        if not os.path.isfile(old_path):
+            return False
+        new_path = os.path.join(self.output_dir, image)
+        os.makedirs(os.path.dirname(new_path), exist_ok=True)
+        os.replace(old_path, new_path)
+        old["image"] = image
+        return True
+
+    def update(self, tile_id, entry):
+        old = self.tiles.get(tile_id)
+        if old and old.get("label") and old["label"] != entry.get("label"):
+            # label moved, e.g. into the labels.jsonl shard
+            old_path = os.path.join(self.output_dir, old["label"])
+            if os.path.isfile(old_path):
+                os.remove(old_path)
+        self.tiles[tile_id] = entry
+        self._pending += 1
+        if self._pending >= self.save_every:
+            self.save()
+
+    def discard(self, tile_id):
+        """Forget tile_id and delete its image and label"""
+        entry = self.tiles.pop(tile_id, None)
+        if not entry:
+            return
+        for key in ("image", "label"):
+            if not entry.get(key):
+                continue
+            path = os.path.join(self.output_dir, entry[key])
+            for candidate in (path, path + ".aux.xml"):
+                if os.path.isfile(candidate):
+                    os.remove(candidate)
+        self._pending += 1
+
+    def remove_orphans(self, tile_ids):
+        """Delete files of manifest tiles that are not in tile_ids"""
+        removed = 0
+        for tile_id in set(self.tiles) - set(tile_ids):
+            self.discard(tile_id)
+            removed += 1
+        if removed:
+            log_debug(f"Removed {removed} orphaned tiles")
+        return removed
+
+    def save(self):
+        """Write the manifest atomically"""
+        if self.before_save:
+            self.before_save()
+        tmp_path = self.path + ".tmp"
+        with open(tmp_path, "w") as f:
+            json.dump({"version": self.VERSION, "tiles": self.tiles}, f)
+        os.replace(tmp_path, self.path)
+        self._pending = 0
+
+class ClassRegistry:
+    """Stable mapping of combined habitat names to YOLO class ids
+
+    Stored as classes.json next to classes.txt in the export directory.
+    Existing ids never change between exports; classes seen for the first
+    time are appended in sorted order. An export directory that only has a
+    classes.txt from an older export, or an unreadable classes.json, starts
+    from classes.txt.
+    """
+    FILENAME = "classes.json"
+    VERSION = 1
+
+    def __init__(self, output_dir):
+        self.path = os.path.join(output_dir, self.FILENAME)
+        self.text_path = os.path.join(output_dir, "classes.txt")
+        self.names = []
+        if os.path.exists(self.path):
+            try:
+                with open(self.path) as f:
+                    self.names = json.load(f).get("classes", [])
+            except (OSError, ValueError, AttributeError) as e:
+                log_debug(f"Ignoring unreadable class registry {self.path}: {e}")
+        if not self.names and os.path.exists(self.text_path):
+            with open(self.text_path) as f:
+                self.names = [line for line in f.read().split('\n') if line]
+        self.ids = {name: i for i, name in enumerate(self.names)}
+
+    def __contains__(self, name):
+        return name in self.ids
+
+    def __getitem__(self, name):
+        return self.ids[name]
+
+    def add(self, names):
+        """Append names not yet registered and return how many were new"""
+        new = sorted(set(names) - set(self.ids))
+        for name in new:
+            self.ids[name] = len(self.names)
+            self.names.append(name)
+        return len(new)
+
+    def save(self):
+        with open(self.path, 'w') as f:
+            json.dump({"version": self.VERSION, "classes": self.names}, f, indent=1)
+        with open(self.text_path, 'w') as f:
+            f.write('\n'.join(self.names))
+
+def yolo_label(class_id):
+    """Whole-tile YOLO label line"""
+    return f"{class_id} 0.5 0.5 1.0 1.0\n"
+
+class LabelWriter:
+    """Buffered writer for YOLO labels, one .txt per tile or a single labels.jsonl"""
+    FORMATS = ("files", "jsonl")
+    JSONL_NAME = "labels.jsonl"
+
+    def __init__(self, output_dir, label_format="files", batch_size=1000, sync=False):
+        if label_format not in self.FORMATS:
+            raise ValueError(f"Unknown label format: {label_format}")
+        self.output_dir = output_dir
+        self.label_format = label_format
+        self.batch_size = batch_size
+        self.sync = sync
+        self._queue = []
+        self._shard = {}
+
+    def label_path(self, tile_id, split=None):
+        """Label path relative to the output directory, None for the shard"""
+        if self.label_format == "files":
+            return os.path.join("labels", *([split] if split else []), f"{tile_id}.txt")
+        return None
+
+    def write(self, tile_id, class_id, split=None):
+        if self.label_format == "jsonl":
+            self._shard[tile_id] = (class_id, split)
+            return
+        self._queue.append((os.path.join(self.output_dir, self.label_path(tile_id, split)), yolo_label(class_id)))
+        if len(self._queue) >= self.batch_size:
+            self.flush()
+
+    def flush(self):
+        """Write queued label files, fsyncing files and directories with sync=True"""
+        for path, text in self._queue:
+            with open(path, 'w') as f:
+                f.write(text)
+                if self.sync:
+                    f.flush()
+                    os.fsync(f.fileno())
+        if self.sync:
+            for directory in {os.path.dirname(path) for path, _ in self._queue}:
+                _fsync_dir(directory)
+        self._queue = []
+
+    def close(self):
+        """Flush, and write the jsonl shard: one tile_id, class_id, label (and split) object per line"""
+        self.flush()
+        if self.label_format != "jsonl":
+            return
+        path = os.path.join(self.output_dir, "labels", self.JSONL_NAME)
+        with open(path, 'w', buffering=1 << 20) as f:
+            for tile_id in sorted(self._shard):
+                class_id, split = self._shard[tile_id]
+                row = {"tile_id": tile_id, "class_id": class_id, "label": yolo_label(class_id).strip()}
+                if split:
+                    row["split"] = split
+                f.write(json.dumps(row) + '\n')
+            if self.sync:
+                f.flush()
+                os.fsync(f.fileno())
+
+def _fsync_dir(path):
+    """Flush the entries of directory path to disk; Windows cannot open directories"""
+    if os.name == "nt":
+        return
+    fd = os.open(path, os.O_RDONLY)
+    try:
+        os.fsync(fd)
+    finally:
+        os.close(fd)
+
+class TarShardWriter:
+    """Stream export samples WebDataset style into tar shards of at most max_bytes"""
+    INDEX_NAME = "index.json"
+    # pax headers allow member names longer than the 100 characters of ustar
+    FORMAT = tarfile.PAX_FORMAT
+
+    def __init__(self, output_dir, max_bytes=1 << 30, prefix="shard", split=None):
+        self.shards_dir = os.path.join(output_dir, "shards", *([split] if split else []))
+        os.makedirs(self.shards_dir, exist_ok=True)
+        # shards are rewritten in full on every export
+        for name in os.listdir(self.shards_dir):
+            if (name.startswith(prefix) and name.endswith(".tar")) or name == self.INDEX_NAME:
+                os.remove(os.path.join(self.shards_dir, name))
+        self.max_bytes = max_bytes
+        self.prefix = prefix
+        self.mtime = int(datetime.now().timestamp())
+        self.shards = []
+        self.samples = {}
+        self._file = None
+        self._tar = None
+
+    @staticmethod
+    def sample_key(tile_id):
+        """Member name stem of tile_id, with dots and slashes replaced"""
+        return str(tile_id).replace(".", "_").replace("/", "_").replace("\\", "_")
+
+    def _next_shard(self):
+        self._close_shard()
+        name = f"{self.prefix}-{len(self.shards):06d}.tar"
+        self._file = open(os.path.join(self.shards_dir, name), 'wb', buffering=1 << 20)
+        self._tar = tarfile.open(fileobj=self._file, mode='w', format=self.FORMAT)
+        self.shards.append({"name": name, "samples": 0, "bytes": 0})
+
+    def _close_shard(self):
+        if self._tar is not None:
+            self._tar.close()
+            self._file.close()
+            self.shards[-1]["bytes"] = os.path.getsize(os.path.join(self.shards_dir, self.shards[-1]["name"]))
+            self._tar = None
+            self._file = None
+
+    def add(self, tile_id, members):
+        """Append one sample; members is a list of (extension, bytes)"""
+        key = self.sample_key(tile_id)
+        infos = []
+        for ext, data in members:
+            info = tarfile.TarInfo(f"{key}.{ext}")
+            info.size = len(data)
+            info.mtime = self.mtime
+            infos.append(info)
+        # headers (with any pax header for a long name) plus padded data
+        size = sum(len(info.tobuf(self.FORMAT, tarfile.ENCODING, "surrogateescape"))
+                   + -(-info.size // tarfile.BLOCKSIZE) * tarfile.BLOCKSIZE for info in infos)
+        shard = self.shards[-1] if self.shards else None
+        if shard is None or (shard["samples"] and self._tar.offset + size > self.max_bytes):
+            self._next_shard()
+            shard = self.shards[-1]
+        self.samples[tile_id] = {"shard": shard["name"], "key": key, "offset": self._tar.offset}
+        for info, (_, data) in zip(infos, members):
+            self._tar.addfile(info, io.BytesIO(data))
+        shard["samples"] += 1
+
+    def close(self):
+        """Close the last shard and write the index of shards and sample offsets"""
+        self._close_shard()
+        with open(os.path.join(self.shards_dir, self.INDEX_NAME), 'w') as f:
+            json.dump({"shards": self.shards, "samples": self.samples}, f)
+
+class PlannedTile:
+    """One tile of an export plan, located in its raster's CRS and pixels"""
+    __slots__ = ('rec', 'raster', 'class_id', 'projwin', 'window', 'blocks', 'split')
+
+    def __init__(self, rec, raster, class_id, projwin, window=None, blocks=None, split=None):
+        self.rec = rec
+        self.raster = raster
+        self.class_id = class_id
+        self.projwin = projwin
+        self.window = window
+        self.blocks = blocks
+        self.split = split
+
+    def read_bytes(self):
+        """Uncompressed bytes of raster data behind the tile"""
+        raster = self.raster
+        if self.window is not None:
+            pixels = self.window[2] * self.window[3]
+        else:
+            gt = raster.geotransform
+            side = self.rec.box_size_pixel or (abs((self.projwin[2] - self.projwin[0]) / gt[1]) if gt else 0)
+            pixels = int(side) ** 2
+        return pixels * (raster.bands or 1) * (raster.pixel_bytes or 1)
+
+def plan_tiles(snapshot, resolver, registry):
+    """Work out the raster window of every exportable record of a LayerSnapshot
+
+    Records without a habitat, without a resolvable raster or outside the
+    raster extent are left out. Returns (planned tiles, tile_ids of the
+    records left out only because their raster was not found).
+    """
+    from .habtile_tiles import snap_window, blocks_touched
+    transforms = {}
+    planned = []
+    unresolved = []
+    for rec in snapshot.records:
+        if not rec.habitat_type:
+            log_debug(f"Skipping tile without habitat: {rec.tile_id}")
             continue
-        image_path = os.path.join(images_dir, f"{tile_id}.jpg")
-        label_path = os.path.join(labels_dir, f"{tile_id}.txt")
-        metadata_path = os.path.join(metadata_dir, f"{tile_id}.csv")
-        extent = raster_layer.extent()
-        if not extent.contains(bbox):
+        raster = resolver.resolve(rec.source_raster)
+        if not raster:
+            unresolved.append(rec.tile_id)
             continue
+        bbox = rec.bbox
         # Ensure bbox is in raster CRS
-        if layer.crs() != raster_layer.crs():
-            transform = QgsCoordinateTransform(layer.crs(), raster_layer.crs(), QgsProject.instance())
-            bbox = transform.transformBoundingBox(bbox)
+        if snapshot.crs != raster.crs:
+            key = raster.crs.authid()
+            if key not in transforms:
+                transforms[key] = QgsCoordinateTransform(snapshot.crs, raster.crs, snapshot.transform_context)
+            bbox = transforms[key].transformBoundingBox(bbox)
+        if not raster.extent.contains(bbox):
+            continue
         # Prepare PROJWIN as [xmin, ymax, xmax, ymin]
         projwin = [bbox.xMinimum(), bbox.yMaximum(), bbox.xMaximum(), bbox.yMinimum()]
-        from osgeo import gdal
-        gdal.Translate(
-            image_path,
-            raster_layer.source(),
-            projWin=projwin   # [xmin, ymax, xmax, ymin] in raster CRS units
-        )
-        class_id = habitat_types.index(habitat_type)
-        with open(label_path, 'w') as f:
-            f.write(f"{class_id} 0.5 0.5 1.0 1.0\n")
-    metadata_path = os.path.join(metadata_dir, f"metadata.csv")
-    with open(metadata_path, 'w', newline='') as f:
-        writer = csv.writer(f)
-        writer.writerow([
-            'tile_id', 'habitat_type', 'confidence', 'source_raster',
-            'pixel_size', 'box_size_m', 'center_x', 'center_y',
-            'observer', 'date_time', 'notes'
+        tile = PlannedTile(rec, raster, registry[rec.habitat_type], projwin)
+        # snap to the raster's pixel grid so chips line up with its blocks
+        gt = raster.geotransform
+        if gt and raster.size:
+            tile.window = snap_window(gt, raster.size, bbox.center().x(), bbox.center().y(),
+                                      rec.box_size_pixel or int(round(bbox.width() / gt[1])))
+        if tile.window is not None and raster.block_size:
+            tile.blocks = blocks_touched(tile.window, raster.block_size)
+        planned.append(tile)
+    return planned, unresolved
+
+def screen_tiles(planned, min_valid_fraction):
+    """Drop planned tiles with less than min_valid_fraction valid pixels
+
+    Each raster is screened once from its overviews (see
+    habtile_tiles.ValidPixelScreen), so no tile is cut just to find out it
+    is empty.
+    """
+    from .habtile_tiles import ValidPixelScreen
+    by_source = {}
+    for tile in planned:
+        by_source.setdefault(tile.raster.source, []).append(tile)
+    kept = []
+    for source, tiles in by_source.items():
+        tile_size = min(tile.window[2] if tile.window else tile.rec.box_size_pixel or 256 for tile in tiles)
+        try:
+            screen = ValidPixelScreen(source, tile_size)
+        except IOError as e:
+            log_debug(f"Export: not screening {source}: {e}")
+            kept.extend(tiles)
+            continue
+        windows = [
+            tile.window if tile.window is not None else screen.window_for_bounds(
+                tile.projwin[0], tile.projwin[3], tile.projwin[2], tile.projwin[1])
+            for tile in tiles
+        ]
+        fractions = screen.fractions(windows)
+        for tile, fraction in zip(tiles, fractions):
+            if fraction >= min_valid_fraction:
+                kept.append(tile)
+            else:
+                log_debug(f"Skipping tile with {fraction:.0%} valid pixels: {tile.rec.tile_id}")
+    return kept
+
+def split_tiles(planned, fractions, block_size=None, seed=0):
+    """Set the train/val/test split of every planned tile
+
+    Tiles are split by spatial blocks of block_size layer units (ten median
+    tile widths by default), stratified by class; see
+    habtile_tiles.spatial_split.
+    """
+    import numpy as np
+    from .habtile_tiles import spatial_split, SPLITS
+    if not planned:
+        return
+    x = np.array([tile.rec.bbox.center().x() for tile in planned])
+    y = np.array([tile.rec.bbox.center().y() for tile in planned])
+    if not block_size:
+        block_size = 10 * float(np.median([tile.rec.bbox.width() for tile in planned])) or 1.0
+    splits = spatial_split(x, y, [tile.class_id for tile in planned], block_size, fractions, seed)
+    for tile, split in zip(planned, splits):
+        tile.split = SPLITS[split]
+    counts = np.bincount(splits, minlength=len(SPLITS))
+    log_debug("Export: split " + ", ".join(f"{name} {count}" for name, count in zip(SPLITS, counts))
+              + f" tiles in blocks of {block_size:g}")
+
+def write_data_yaml(output_dir, registry, splits):
+    """Write the YOLO dataset file for a split export in images/<split>/"""
+    lines = [f"path: {json.dumps(os.path.abspath(output_dir))}"]
+    for split in splits:
+        lines.append(f"{split}: images/{split}")
+    lines.append(f"nc: {len(registry.names)}")
+    lines.append("names:")
+    lines.extend(f"  {i}: {json.dumps(name)}" for i, name in enumerate(registry.names))
+    with open(os.path.join(output_dir, "data.yaml"), 'w') as f:
+        f.write("\n".join(lines) + "\n")
+
+def order_tiles(planned, tile_order):
+    """Sort planned tiles by raster, then by tile_order within each raster
+
+    "hilbert" and "zorder" follow a space-filling curve over the tile
+    centres, "block" goes block row by block row and "fid" keeps the layer
+    order. Consecutive tiles then hit neighbouring blocks and the GDAL and
+    OS caches stay warm.
+    """
+    from .habtile_tiles import curve_index, CURVES
+
+    def block_order(tile):
+        block_size = tile.raster.block_size
+        if tile.window is None or not block_size:
+            return (tile.raster.source, 0, 0)
+        return (tile.raster.source, tile.window[1] // block_size[1], tile.window[0] // block_size[0])
+
+    def curve_order(tile):
+        extent = tile.raster.extent
+        center_x = (tile.projwin[0] + tile.projwin[2]) / 2
+        center_y = (tile.projwin[1] + tile.projwin[3]) / 2
+        return (tile.raster.source, curve_index(tile_order, center_x, center_y, (
+            extent.xMinimum(), extent.yMinimum(), extent.xMaximum(), extent.yMaximum()
+        )))
+
+    if tile_order == "block":
+        planned.sort(key=block_order)
+    elif tile_order in CURVES:
+        planned.sort(key=curve_order)
+    blocks = [tile.blocks for tile in planned if tile.blocks is not None]
+    if blocks:
+        log_debug(f"Export: {sum(blocks)} blocks decoded for {len(blocks)} tiles "
+                  f"(mean {sum(blocks) / len(blocks):.1f}, max {max(blocks)} per tile)")
+
+class ExportReport:
+    """Progress, cancellation and throughput of one export_to_yolo run
+
+    Each stage takes its share of the progress bar of an optional
+    QgsProcessingFeedback (STAGES weights, in percent). Stage wall times,
+    tile counts and the bytes read from the rasters (uncompressed) and
+    written to the output are collected for summary().
+    """
+    STAGES = (("scan", 10), ("plan", 5), ("manifest", 5), ("cut", 70), ("labels", 5), ("metadata", 5))
+
+    def __init__(self, feedback=None):
+        self.feedback = feedback
+        self.seconds = {}
+        self.tiles = {"planned": 0, "cut": 0, "unchanged": 0, "failed": 0}
+        self.bytes_read = 0
+        self.bytes_written = 0
+        self._began = time.perf_counter()
+        self._offset = 0
+        self._weight = 0
+        self._total = 0
+        self._done = 0
+
+    @contextmanager
+    def stage(self, name):
+        """Time a stage and move the progress bar to its share"""
+        offset = 0
+        for stage, weight in self.STAGES:
+            if stage == name:
+                break
+            offset += weight
+        self._offset, self._weight = offset, weight
+        if self.feedback is not None:
+            self.feedback.setProgressText(f"Export: {name}")
+            self.feedback.setProgress(offset)
+        start = time.perf_counter()
+        try:
+            with PROFILER.span(f"export.{name}"):
+                yield
+        finally:
+            self.seconds[name] = self.seconds.get(name, 0.0) + time.perf_counter() - start
+            if self.feedback is not None and not self.feedback.isCanceled():
+                self.feedback.setProgress(offset + weight)
+
+    def is_canceled(self):
+        return self.feedback is not None and self.feedback.isCanceled()
+
+    def start_tiles(self, total):
+        """Begin counting total tiles through the current stage"""
+        self._total = total
+        self._done = 0
+
+    def tile_done(self, written, read=0):
+        """Record one tile; written is None for a tile that failed"""
+        self._done += 1
+        if written is None:
+            self.tiles["failed"] += 1
+            PROFILER.count("export.tile_failed")
+        else:
+            PROFILER.observe("export.tile_bytes", written)
+            self.tiles["cut"] += 1
+            self.bytes_written += written
+            self.bytes_read += read
+        if self.feedback is not None and self._total and (self._done % 50 == 0 or self._done == self._total):
+            self.feedback.setProgress(self._offset + self._weight * self._done / self._total)
+
+    def summary(self):
+        cut_seconds = self.seconds.get("cut", 0.0)
+        return {
+            "tiles": dict(self.tiles),
+            "stage_seconds": {name: round(value, 3) for name, value in self.seconds.items()},
+            "total_seconds": round(time.perf_counter() - self._began, 3),
+            "tiles_per_second": round(self.tiles["cut"] / cut_seconds, 2) if cut_seconds else None,
+            "mb_read": round(self.bytes_read / 1e6, 3),
+            "mb_written": round(self.bytes_written / 1e6, 3),
+            "mb_read_per_second": round(self.bytes_read / 1e6 / cut_seconds, 3) if cut_seconds else None,
+        }
+
+    def log(self):
+        """Write the summary to the processing log, or the HabTile log without feedback"""
+        summary = self.summary()
+        tiles = summary["tiles"]
+        lines = [
+            f"Export: {tiles['cut']} tiles cut, {tiles['unchanged']} unchanged, "
+            f"{tiles['failed']} failed of {tiles['planned']} planned",
+            f"Export: {summary['mb_read']:.1f} MB read, {summary['mb_written']:.1f} MB written, "
+            f"{summary['tiles_per_second'] or 0:.1f} tiles/s",
+            "Export: " + ", ".join(f"{name} {value:.2f}s" for name, value in summary["stage_seconds"].items()),
+        ]
+        for line in lines:
+            if self.feedback is not None:
+                self.feedback.pushInfo(line)
+            log_debug(line)
+
+    def save(self, path):
+        with open(path, 'w') as f:
+            json.dump(self.summary(), f, indent=1)
+
+def _export_tile_files(planned, output_dir, workers, label_format, sync, report, unresolved):
+    """Write images and labels as files, skipping tiles unchanged since the last export
+
+    Files of earlier tiles that are not planned now are deleted, except for
+    the unresolved tile_ids whose raster is merely not found this time.
+    """
+    from .habtile_tiles import cut_tiles
+    os.makedirs(os.path.join(output_dir, "images"), exist_ok=True)
+    os.makedirs(os.path.join(output_dir, "labels"), exist_ok=True)
+    for split in {tile.split for tile in planned if tile.split}:
+        os.makedirs(os.path.join(output_dir, "images", split), exist_ok=True)
+        if label_format == "files":
+            os.makedirs(os.path.join(output_dir, "labels", split), exist_ok=True)
+    labels = LabelWriter(output_dir, label_format, sync=sync)
+    manifest = ExportManifest(output_dir, before_save=labels.flush)
+    to_cut = []
+    with report.stage("manifest"):
+        for tile in planned:
+            rec = tile.rec
+            entry = {
+                "geometry": rec.geometry_hash,
+                "attributes": ExportManifest.attribute_hash(rec.habitat_type, tile.class_id),
+                "source_raster": tile.raster.source,
+                "raster_mtime": tile.raster.mtime,
+                "image": os.path.join("images", *([tile.split] if tile.split else []), f"{rec.tile_id}.jpg"),
+            }
+            if labels.label_path(rec.tile_id, tile.split):
+                entry["label"] = labels.label_path(rec.tile_id, tile.split)
+            if tile.blocks is not None:
+                entry["blocks"] = tile.blocks
+            # a tile that changed split is moved rather than cut again
+            manifest.move_image(rec.tile_id, entry["image"])
+            if manifest.image_current(rec.tile_id, entry):
+                entry["checksum"] = manifest.tiles[rec.tile_id]["checksum"]
+                if not manifest.label_current(rec.tile_id, entry):
+                    labels.write(rec.tile_id, tile.class_id, tile.split)
+                    manifest.update(rec.tile_id, entry)
+                elif label_format == "jsonl":
+                    labels.write(rec.tile_id, tile.class_id, tile.split)
+                continue
+            to_cut.append((tile, entry))
+    manifest.remove_orphans([tile.rec.tile_id for tile in planned] + list(unresolved))
+    log_debug(f"Export: {len(to_cut)} tiles to cut, {len(planned) - len(to_cut)} unchanged")
+    report.tiles["unchanged"] = len(planned) - len(to_cut)
+
+    # cut tiles, serially or on a process pool, writing labels and recording
+    # finished tiles in the manifest as they complete
+    report.start_tiles(len(to_cut))
+
+    def tile_done(i, result):
+        tile, entry = to_cut[i]
+        report.tile_done(None if result is None else result[0], tile.read_bytes())
+        if result is None:
+            log_debug(f"Could not cut tile {tile.rec.tile_id} from {tile.raster.source}")
+            manifest.discard(tile.rec.tile_id)
+            return
+        labels.write(tile.rec.tile_id, tile.class_id, tile.split)
+        entry["checksum"] = result[1]
+        manifest.update(tile.rec.tile_id, entry)
+
+    jobs = [
+        (tile.raster.source, tile.projwin, os.path.join(output_dir, entry["image"]), tile.window)
+        for tile, entry in to_cut
+    ]
+    try:
+        with report.stage("cut"):
+            cut_tiles(jobs, workers=workers, callback=tile_done, is_canceled=report.is_canceled)
+    finally:
+        with report.stage("labels"):
+            manifest.save()
+            labels.close()
+
+def _export_tar_shards(planned, output_dir, workers, registry, shard_bytes, report):
+    """Stream images, labels and per-tile metadata into tar shards"""
+    from .habtile_tiles import cut_tiles
+    writers = {
+        split: TarShardWriter(output_dir, max_bytes=shard_bytes, split=split)
+        for split in sorted({tile.split for tile in planned}, key=str)
+    }
+
+    report.start_tiles(len(planned))
+
+    def tile_done(i, data):
+        tile = planned[i]
+        report.tile_done(None if data is None else len(data), tile.read_bytes())
+        rec = tile.rec
+        if data is None:
+            log_debug(f"Could not cut tile {rec.tile_id} from {tile.raster.source}")
+            return
+        info = dict(zip(METADATA_HEADER, rec.metadata))
+        info.update({
+            "class_id": tile.class_id,
+            "class_name": registry.names[tile.class_id],
+            "window": tile.window,
+        })
+        if tile.split:
+            info["split"] = tile.split
+        writers[tile.split].add(rec.tile_id, [
+            ("jpg", data),
+            ("txt", yolo_label(tile.class_id).encode("utf-8")),
+            ("json", json.dumps(info, default=str).encode("utf-8")),
         ])
-        for feature in layer.getFeatures():
-            habitat_fields = ["habitat_1", "habitat_2", "habitat_3", "habitat_4"]
-            habs = filter(lambda x: 'NULL' not in x, [str(feature[field]).strip() for field in habitat_fields])
-            habitat_type = "; ".join(habs)
-            writer.writerow([
-                feature["tile_id"], habitat_type, feature["confidence"] if "confidence" in feature.fields().names() else "",
-                raster_name, feature["pixel_size"], feature["box_size_m"],
-                feature["center_x"], feature["center_y"],
-                feature["observer"] if "observer" in feature.fields().names() else "",
-                feature["date_time"].toString() if "date_time" in feature.fields().names() else "",
-                feature["notes"] if "notes" in feature.fields().names() else ""
-            ])
-    with open(class_file, 'w') as f:
-        f.write('\n'.join(habitat_types))
 
+    jobs = [(tile.raster.source, tile.projwin, None, tile.window) for tile in planned]
+    try:
+        with report.stage("cut"):
+            cut_tiles(jobs, workers=workers, callback=tile_done, output="encoded", is_canceled=report.is_canceled)
+    finally:
+        with report.stage("labels"):
+            for shards in writers.values():
+                shards.close()
+    for split, shards in writers.items():
+        name = f"{split} " if split else ""
+        log_debug(f"Export: {len(shards.samples)} {name}samples in {len(shards.shards)} shards")
+
+def _export_chip_store(planned, output_dir, workers, report):
+    """Read raw chips into a single memory-mapped array (see ChipStoreWriter)"""
+    from .habtile_tiles import cut_tiles
+    from .habtile_chips import ChipStoreWriter
+    # rotated rasters have no pixel window, so their size is not known up front
+    chips = [tile for tile in planned if tile.window is not None and tile.raster.bands]
+    if len(chips) < len(planned):
+        log_debug(f"Export: {len(planned) - len(chips)} tiles without a pixel window left out of the chip store")
+    # the store holds uint8 pixels; other data types would be clamped
+    wide = {tile.raster.source: tile.raster.data_type for tile in chips if tile.raster.data_type != "Byte"}
+    for source, data_type in wide.items():
+        log_debug(f"Export: skipping {source} in the chip store, its {data_type} pixels are not 8 bit")
+    chips = [tile for tile in chips if tile.raster.source not in wide]
+    if not chips:
+        log_debug("Export: no chips to store")
+        return
+    store = ChipStoreWriter(
+        output_dir,
+        [(tile.window[3], tile.window[2], tile.raster.bands) for tile in chips],
+        [tile.class_id for tile in chips],
+        [tile.rec.tile_id for tile in chips],
+        [tile.split or "" for tile in chips]
+    )
+
+    report.start_tiles(len(chips))
+
+    def tile_done(i, data):
+        report.tile_done(None if data is None else len(data), chips[i].read_bytes())
+        if data is None:
+            log_debug(f"Could not read chip {chips[i].rec.tile_id} from {chips[i].raster.source}")
+            return
+        store.write(i, data)
+
+    jobs = [(tile.raster.source, tile.projwin, None, tile.window) for tile in chips]
+    try:
+        with report.stage("cut"):
+            cut_tiles(jobs, workers=workers, callback=tile_done, output="raw", is_canceled=report.is_canceled)
+    finally:
+        with report.stage("labels"):
+            store.close()
+    log_debug(f"Export: {int(store.valid.sum())} chips stored in {store.array_path}")
+
+# "files" writes images/ and labels/, "tar" tar shards (see TarShardWriter) and
+# "npy" one memory-mapped array of 8 bit chips (see habtile_chips.ChipStoreWriter)
+OUTPUT_FORMATS = ("files", "tar", "npy")
+
+def export_to_yolo(layer, output_dir, raster_search_paths=None, workers=1, tile_order="hilbert",
+                   label_format="files", sync=False, output_format="files", shard_bytes=1 << 30,
+                   min_valid_fraction=0.0, split=None, split_block_size=None, split_seed=0,
+                   feedback=None, resolver=None, write_report=False):
+    """Export habitat classifications to YOLO format
+
+    layer may be a LayerSnapshot read earlier. Returns the ExportReport
+    summary, also written to export_report.json with write_report=True.
+    """
+    import os, csv
+    if not output_dir:
+        raise ValueError("Output directory not specified")
+    if isinstance(layer, LayerSnapshot):
+        count = len(layer.records)
+    else:
+        count = layer.featureCount() if layer else 0
+    if count == 0:
+        raise ValueError("No habitat classifications to export")
+    if output_format not in OUTPUT_FORMATS:
+        raise ValueError(f"Unknown output format: {output_format}")
+    # a background export passes a resolver built on the main thread (see ExportTask)
+    resolver = resolver or RasterResolver(raster_search_paths)
+    metadata_dir = os.path.join(output_dir, "metadata")
+    os.makedirs(metadata_dir, exist_ok=True)
+
+    report = ExportReport(feedback)
+
+    # phase 1: collect records and register their classes
+    with report.stage("scan"):
+        snapshot = layer if isinstance(layer, LayerSnapshot) else LayerSnapshot(layer)
+        records = snapshot.records
+        registry = ClassRegistry(output_dir)
+        added = registry.add(rec.habitat_type for rec in records if rec.habitat_type)
+        if added:
+            log_debug(f"Export: {added} new classes appended to {registry.path}")
+        registry.save()
+    if report.is_canceled():
+        return _export_canceled(report)
+
+    # phase 2: plan tile windows in raster CRS and order the reads
+    with report.stage("plan"):
+        planned, unresolved = plan_tiles(snapshot, resolver, registry)
+        if min_valid_fraction > 0:
+            planned = screen_tiles(planned, min_valid_fraction)
+        if split:
+            split_tiles(planned, split, split_block_size, split_seed)
+        order_tiles(planned, tile_order)
+    report.tiles["planned"] = len(planned)
+    if report.is_canceled():
+        return _export_canceled(report)
+
+    # phase 3: cut tiles and write labels
+    if output_format == "tar":
+        _export_tar_shards(planned, output_dir, workers, registry, shard_bytes, report)
+    elif output_format == "npy":
+        _export_chip_store(planned, output_dir, workers, report)
+    else:
+        _export_tile_files(planned, output_dir, workers, label_format, sync, report, unresolved)
+        if split:
+            from .habtile_tiles import SPLITS
+            write_data_yaml(output_dir, registry, [name for name, f in zip(SPLITS, split) if f > 0])
+    if report.is_canceled():
+        return _export_canceled(report)
+
+    # phase 4: stream metadata rows into a single CSV
+    with report.stage("metadata"):
+        metadata_path = os.path.join(metadata_dir, "metadata.csv")
+        with open(metadata_path, 'w', newline='', buffering=1 << 20) as f:
+            writer = csv.writer(f)
+            writer.writerow(METADATA_HEADER)
+            for rec in records:
+                writer.writerow(rec.metadata)
+    report.log()
+    if write_report:
+        report.save(os.path.join(output_dir, "export_report.json"))
+    return report.summary()
+
+def _export_canceled(report):
+    log_debug("Export canceled")
+    report.log()
+    return report.summary()
+
+
+
+class ExportTask(QgsTask):
+    """Run export_to_yolo in the background on a snapshot of a habitat layer
+
+    The features are read into a LayerSnapshot and the project rasters are
+    indexed when the task is created, on the main thread, so the worker
+    thread never touches the layer or the project and the habitat layer can
+    be edited while the export runs. Progress and cancellation go
+    through a QgsProcessingFeedback. on_finished(ok, task) is called on the
+    main thread when the task ends; task.error holds the exception of a
+    failed export.
+    """
+
+    def __init__(self, layer, output_dir, on_finished=None, raster_search_paths=None, **options):
+        super().__init__(f"Export {layer.name()} to YOLO", QgsTask.CanCancel)
+        self.snapshot = LayerSnapshot(layer)
+        self.resolver = RasterResolver(raster_search_paths)
+        self.output_dir = output_dir
+        self.options = options
+        self.on_finished = on_finished
+        self.error = None
+        self.summary = None
+        self.feedback = QgsProcessingFeedback()
+        self.feedback.progressChanged.connect(self.setProgress)
+
+    def run(self):
+        try:
+            self.summary = export_to_yolo(self.snapshot, self.output_dir, resolver=self.resolver,
+                                          feedback=self.feedback, **self.options)
+        except Exception as e:
+            self.error = e
+            return False
+        return not self.isCanceled()
+
+    def cancel(self):
+        self.feedback.cancel()
+        super().cancel()
 
+    def finished(self, result):
+        if self.on_finished:
+            self.on_finished(result, self)
 
 
 from qgis.PyQt.QtWidgets import QDialog, QVBoxLayout, QComboBox, QPushButton, QLabel
@@ -0,0 +1,91 @@
+"""
+Memory-mapped chip store for the HabTile YOLO export
+
+Chips are written into one preallocated .npy array so a training loader can
+open the dataset with np.load(mmap_mode="r") and slice chips lazily, with no
+image decoding and no copies. This module only depends on NumPy.
+"""
+import os
+
+import numpy as np
+
+
+CHIPS_NAME = "chips.npy"
+INDEX_NAME = "chips_index.npz"
+
+
+class ChipStoreWriter:
+    """Write uint8 chips into a preallocated memory-mapped array
+
+    shapes is the (height, width, bands) of every chip, known up front from
+    the export plan. When all chips share a shape the array is stored as
+    (count, height, width, bands); otherwise it is a flat byte array and
+    chip i lives at offsets[i] with shapes[i]. The sidecar chips_index.npz
+    holds offsets, shapes, class_ids, tile_ids, splits ("train", "val",
+    "test" or "" when the export is not split) and a valid flag per chip.
+    """
+
+    def __init__(self, output_dir, shapes, class_ids, tile_ids, splits=None):
+        self.output_dir = output_dir
+        self.shapes = np.asarray(shapes, dtype=np.int32).reshape(-1, 3)
+        sizes = self.shapes.prod(axis=1).astype(np.int64)
+        self.offsets = np.zeros(len(sizes), dtype=np.int64)
+        if len(sizes):
+            self.offsets[1:] = np.cumsum(sizes)[:-1]
+        self.class_ids = np.asarray(class_ids, dtype=np.int32)
+        self.tile_ids = np.asarray([str(tile_id) for tile_id in tile_ids])
+        self.splits = np.asarray([str(split) for split in splits] if splits is not None else [""] * len(sizes))
+        self.valid = np.zeros(len(sizes), dtype=bool)
+        self.uniform = len(sizes) > 0 and bool((self.shapes == self.shapes[0]).all())
+        self.array_path = os.path.join(output_dir, CHIPS_NAME)
+        if self.uniform:
+            shape = (len(sizes),) + tuple(int(v) for v in self.shapes[0])
+        else:
+            shape = (int(sizes.sum()),)
+        self.array = np.lib.format.open_memmap(self.array_path, mode="w+", dtype=np.uint8, shape=shape)
+
+    def write(self, i, data):
+        """Store chip i from raw pixel-interleaved bytes"""
+        chip = np.frombuffer(data, dtype=np.uint8)
+        if self.uniform:
+            self.array[i] = chip.reshape(self.array.shape[1:])
+        else:
+            self.array[self.offsets[i]:self.offsets[i] + chip.size] = chip
+        self.valid[i] = True
+
+    def close(self):
+        self.array.flush()
+        self.array = None
+        np.savez(
+            os.path.join(self.output_dir, INDEX_NAME),
+            offsets=self.offsets, shapes=self.shapes, class_ids=self.class_ids,
+            tile_ids=self.tile_ids, splits=self.splits, valid=self.valid
+        )
+
+
+class ChipStore:
+    """Read-only view of an exported chip store
+
+    chips[i] returns chip i as a (height, width, bands) view into the
+    memory map; nothing is read from disk until the pixels are used.
+    """
+
+    def __init__(self, output_dir):
+        self.array = np.load(os.path.join(output_dir, CHIPS_NAME), mmap_mode="r")
+        with np.load(os.path.join(output_dir, INDEX_NAME)) as index:
+            self.offsets = index["offsets"]
+            self.shapes = index["shapes"]
+            self.class_ids = index["class_ids"]
+            self.tile_ids = index["tile_ids"]
+            self.valid = index["valid"]
+            self.splits = index["splits"] if "splits" in index else np.full(len(self.offsets), "")
+
+    def __len__(self):
+        return len(self.offsets)
+
+    def __getitem__(self, i):
+        if self.array.ndim == 4:
+            return self.array[i]
+        shape = tuple(self.shapes[i])
+        start = self.offsets[i]
+        return self.array[start:start + int(np.prod(shape))].reshape(shape)
@@ -0,0 +1,195 @@
+"""
+Headless HabTile YOLO export
+
+Runs export_to_yolo on habitat layers from GeoPackages without a QGIS
+desktop, iface or map canvas, e.g. for nightly dataset builds on a Linux
+node::
+
+    python habtile_cli.py habitat_a.gpkg habitat_b.gpkg -o /data/yolo -r /data/mosaics
+
+Every habitat layer found (all layers with the habitat fields, or the
+--layer ones) is exported in the same process, so QGIS starts once per
+batch. With more than one layer each goes into its own subdirectory of the
+output directory, named after the layer, or <GeoPackage name>_<layer> when
+several GeoPackages have a layer of that name. Set QGIS_PREFIX_PATH if QGIS
+is not found; the Qt platform defaults to offscreen.
+"""
+import argparse
+import importlib
+import os
+import sys
+
+
+def start_qgis():
+    """Start a QgsApplication without a display and make processing importable"""
+    os.environ.setdefault("QT_QPA_PLATFORM", "offscreen")
+    from qgis.core import QgsApplication
+    app = QgsApplication([], False)
+    app.initQgis()
+    # habtile imports the processing plugin, which lives with QGIS's python plugins
+    plugins = os.path.join(QgsApplication.pkgDataPath(), "python", "plugins")
+    if plugins not in sys.path:
+        sys.path.append(plugins)
+    return app
+
+
+def load_habtile():
+    """Import habtile as part of the plugin package, so it can load its sibling modules"""
+    if __package__:
+        return importlib.import_module(f"{__package__}.habtile")
+    plugin_dir = os.path.dirname(os.path.abspath(__file__))
+    sys.path.insert(0, os.path.dirname(plugin_dir))
+    return importlib.import_module(f"{os.path.basename(plugin_dir)}.habtile")
+
+
+def habitat_layers(path, names, habtile):
+    """(name, QgsVectorLayer) of the habitat layers in a GeoPackage"""
+    from osgeo import ogr
+    from qgis.core import QgsVectorLayer
+    ds = ogr.Open(path)
+    if ds is None:
+        raise ValueError(f"Could not open {path}")
+    available = [ds.GetLayerByIndex(i).GetName() for i in range(ds.GetLayerCount())]
+    ds = None
+    missing = [name for name in names if name not in available]
+    if missing:
+        raise ValueError(f"{path} has no layer {', '.join(missing)}")
+    required = [name for name, _, _ in habtile.HABITAT_LAYER_FIELDS]
+    layers = []
+    for name in names or available:
+        layer = QgsVectorLayer(f"{path}|layername={name}", name, "ogr")
+        if not layer.isValid():
+            raise ValueError(f"Could not load layer {name} from {path}")
+        lacking = [field for field in required if field not in layer.fields().names()]
+        if lacking:
+            if names:
+                raise ValueError(f"Layer {name} in {path} is missing fields: {', '.join(lacking)}")
+            continue
+        layers.append((name, layer))
+    return layers
+
+
+def make_feedback(quiet):
+    """QgsProcessingFeedback that prints messages and progress to stderr"""
+    from qgis.core import QgsProcessingFeedback
+
+    class CliFeedback(QgsProcessingFeedback):
+        def pushInfo(self, info):
+            if not quiet:
+                print(info, file=sys.stderr)
+
+        def reportError(self, error, fatalError=False):
+            print(f"ERROR: {error}", file=sys.stderr)
+
+    feedback = CliFeedback()
+    if not quiet:
+        last = [-10]
+
+        def progress(value):
+            if value >= last[0] + 10 or value >= 100:
+                last[0] = value
+                print(f"  {value:.0f}%", file=sys.stderr)
+        feedback.progressChanged.connect(progress)
+    return feedback
+
+
+def build_parser():
+    """Argument parser; the values of the format options are checked by check_choices"""
+    parser = argparse.ArgumentParser(description="Export HabTile habitat layers to YOLO datasets.")
+    parser.add_argument("gpkg", nargs="+", help="habitat GeoPackage(s)")
+    parser.add_argument("-o", "--output-dir", required=True, help="dataset output directory")
+    parser.add_argument("-l", "--layer", action="append", default=[],
+                        help="layer to export (repeatable); default every habitat layer")
+    parser.add_argument("-r", "--raster-dir", action="append", default=[],
+                        help="directory searched for source rasters (repeatable)")
+    parser.add_argument("--workers", type=int, default=1, help="tile cutting processes")
+    parser.add_argument("--tile-order", default="hilbert", help="read order within each raster")
+    parser.add_argument("--label-format", default="files", help="label files or one labels.jsonl")
+    parser.add_argument("--output-format", default="files", help="image files, tar shards or an npy chip store")
+    parser.add_argument("--shard-size", type=int, default=1024, help="maximum tar shard size in MB")
+    parser.add_argument("--sync", action="store_true", help="fsync label files as they are written")
+    parser.add_argument("--min-valid", type=float, default=0.0,
+                        help="skip tiles with less valid (not nodata) pixels than this percentage")
+    parser.add_argument("--val", type=float, default=0.0, help="validation split percentage")
+    parser.add_argument("--test", type=float, default=0.0, help="test split percentage")
+    parser.add_argument("--split-block", type=float, default=None,
+                        help="split block size in layer units (default ten tile widths)")
+    parser.add_argument("--report", action="store_true", help="write export_report.json per dataset")
+    parser.add_argument("-q", "--quiet", action="store_true", help="only print errors")
+    parser.add_argument("-v", "--verbose", action="store_true", help="also print the HabTile log")
+    return parser
+
+
+def check_choices(parser, args, habtile):
+    """Check the format options against the plugin's own lists"""
+    for option, value, choices in (
+        ("--tile-order", args.tile_order, habtile.ExportToYoloAlgorithm.TILE_ORDERS),
+        ("--label-format", args.label_format, habtile.LabelWriter.FORMATS),
+        ("--output-format", args.output_format, habtile.OUTPUT_FORMATS),
+    ):
+        if value not in choices:
+            parser.error(f"argument {option}: invalid choice: {value!r} (choose from {', '.join(choices)})")
+
+
+def output_dirs(output_dir, jobs):
+    """Output directory of each (path, name, layer) job"""
+    if len(jobs) == 1:
+        return [output_dir]
+    names = [name for _, name, _ in jobs]
+    return [
+        os.path.join(output_dir, name if names.count(name) == 1
+                     else f"{os.path.splitext(os.path.basename(path))[0]}_{name}")
+        for path, name, _ in jobs
+    ]
+
+
+def main(argv=None):
+    # parse before starting QGIS, so --help and usage errors return at once
+    parser = build_parser()
+    args = parser.parse_args(argv)
+    if args.val + args.test >= 100:
+        parser.error("validation and test splits must leave some tiles for training")
+    app = start_qgis()
+    try:
+        habtile = load_habtile()
+        check_choices(parser, args, habtile)
+        if args.verbose:
+            from qgis.core import QgsApplication
+            QgsApplication.messageLog().messageReceived.connect(
+                lambda message, tag, level: print(f"[{tag}] {message}", file=sys.stderr)
+            )
+        split = (100 - args.val - args.test, args.val, args.test) if args.val or args.test else None
+
+        jobs = []
+        for path in args.gpkg:
+            try:
+                jobs.extend((path, name, layer) for name, layer in habitat_layers(path, args.layer, habtile))
+            except ValueError as e:
+                print(f"ERROR: {e}", file=sys.stderr)
+                return 2
+        if not jobs:
+            print("No habitat layers found.", file=sys.stderr)
+            return 2
+
+        failed = 0
+        for (path, name, layer), output_dir in zip(jobs, output_dirs(args.output_dir, jobs)):
+            if not args.quiet:
+                print(f"Exporting {name} ({layer.featureCount()} tiles) to {output_dir}", file=sys.stderr)
+            try:
+                habtile.export_to_yolo(
+                    layer, output_dir, args.raster_dir, workers=args.workers, tile_order=args.tile_order,
+                    label_format=args.label_format, sync=args.sync, output_format=args.output_format,
+                    shard_bytes=args.shard_size * 1024 * 1024, min_valid_fraction=args.min_valid / 100.0,
+                    split=split, split_block_size=args.split_block, feedback=make_feedback(args.quiet),
+                    write_report=args.report
+                )
+            except Exception as e:
+                print(f"ERROR: export of {name} from {path} failed: {e}", file=sys.stderr)
+                failed += 1
+        return 1 if failed else 0
+    finally:
+        app.exitQgis()
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,503 @@
+"""
+Tile cutting for the HabTile YOLO export
+
+This module only depends on GDAL (and NumPy, which GDAL's array access needs)
+so it can be used outside a QGIS session.
+"""
+import hashlib
+import math
+import multiprocessing
+import multiprocessing.spawn
+import os
+import sys
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+from osgeo import gdal
+
+
+class TileCutter:
+    """Cut image chips from source rasters, keeping each dataset open
+
+    Datasets are opened on first use and pinned for the life of the cutter,
+    so every tile costs a windowed read plus an encode instead of a full
+    gdal.Translate (reopen, header and overview parsing, cold block cache).
+    """
+
+    def __init__(self, driver="JPEG", creation_options=None):
+        self.driver = gdal.GetDriverByName(driver)
+        self.creation_options = creation_options or []
+        self._datasets = {}
+        self._counter = 0
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+    def open(self, source):
+        """Return the pinned dataset for source, opening it on first use"""
+        if source not in self._datasets:
+            # a failed open is cached as None so it is not retried per tile
+            self._datasets[source] = gdal.Open(source, gdal.GA_ReadOnly)
+        return self._datasets[source]
+
+    def close(self):
+        """Release all open datasets"""
+        self._datasets.clear()
+
+    def window(self, source, projwin):
+        """Convert projwin [xmin, ymax, xmax, ymin] to a pixel window
+
+        Returns (xoff, yoff, xsize, ysize) clipped to the raster, or None for
+        rotated rasters and windows outside the raster. Rounding follows
+        gdal.Translate so chips match the previous output.
+        """
+        ds = self.open(source)
+        if ds is None:
+            return None
+        gt = ds.GetGeoTransform()
+        if gt[2] != 0 or gt[4] != 0:
+            return None
+        xmin, ymax, xmax, ymin = projwin
+        xoff = int(math.floor((xmin - gt[0]) / gt[1] + 0.001))
+        yoff = int(math.floor((ymax - gt[3]) / gt[5] + 0.001))
+        xsize = int(math.floor((xmax - xmin) / gt[1] + 0.5))
+        ysize = int(math.floor((ymin - ymax) / gt[5] + 0.5))
+        xoff, yoff = max(xoff, 0), max(yoff, 0)
+        xsize = min(xsize, ds.RasterXSize - xoff)
+        ysize = min(ysize, ds.RasterYSize - yoff)
+        if xsize <= 0 or ysize <= 0:
+            return None
+        return xoff, yoff, xsize, ysize
+
+    def read(self, source, window):
+        """Read all bands of window from the pinned dataset as raw bytes"""
+        xoff, yoff, xsize, ysize = window
+        return self.open(source).ReadRaster(xoff, yoff, xsize, ysize)
+
+    def _memory_dataset(self, source, window):
+        ds = self.open(source)
+        xoff, yoff, xsize, ysize = window
+        band = ds.GetRasterBand(1)
+        mem = gdal.GetDriverByName("MEM").Create("", xsize, ysize, ds.RasterCount, band.DataType)
+        mem.WriteRaster(0, 0, xsize, ysize, self.read(source, window))
+        gt = ds.GetGeoTransform()
+        mem.SetGeoTransform((
+            gt[0] + xoff * gt[1], gt[1], 0.0,
+            gt[3] + yoff * gt[5], 0.0, gt[5]
+        ))
+        mem.SetProjection(ds.GetProjection())
+        for i in range(1, ds.RasterCount + 1):
+            mem.GetRasterBand(i).SetColorInterpretation(ds.GetRasterBand(i).GetColorInterpretation())
+        return mem
+
+    def _vsimem_path(self):
+        self._counter += 1
+        return f"/vsimem/habtile_{id(self)}_{self._counter}.jpg"
+
+    def encode(self, source, window):
+        """Encode window to the output format in memory
+
+        Returns (image_bytes, aux_xml_bytes); the second item is None when
+        the driver wrote no georeferencing sidecar.
+        """
+        path = self._vsimem_path()
+        mem = self._memory_dataset(source, window)
+        out = self.driver.CreateCopy(path, mem, 0, self.creation_options)
+        if out is None:
+            raise RuntimeError(f"Could not encode tile from {source}: {gdal.GetLastErrorMsg()}")
+        out = None
+        mem = None
+        data = _read_vsimem(path)
+        aux = _read_vsimem(path + ".aux.xml")
+        return data, aux
+
+    def encode_tile(self, source, projwin, window=None):
+        """Encode the chip covering projwin in memory
+
+        window is an optional pixel window (see snap_window) used instead of
+        projwin. Returns (image_bytes, aux_xml_bytes) as for encode, or None
+        if the raster could not be read.
+        """
+        ds = self.open(source)
+        if ds is None:
+            return None
+        gt = ds.GetGeoTransform()
+        if gt[2] != 0 or gt[4] != 0:
+            # rotated raster: fall back to gdal.Translate on the pinned handle
+            path = self._vsimem_path()
+            options = gdal.TranslateOptions(
+                format=self.driver.ShortName, projWin=projwin, creationOptions=self.creation_options
+            )
+            if gdal.Translate(path, ds, options=options) is None:
+                return None
+            return _read_vsimem(path), _read_vsimem(path + ".aux.xml")
+        if window is None:
+            window = self.window(source, projwin)
+        if window is None:
+            return None
+        return self.encode(source, window)
+
+    def cut(self, source, projwin, image_path, window=None):
+        """Write the chip covering projwin to image_path
+
+        Returns (bytes_written, sha1_hexdigest) for the image, or None if
+        the raster could not be read.
+        """
+        encoded = self.encode_tile(source, projwin, window)
+        if encoded is None:
+            return None
+        data, aux = encoded
+        with open(image_path, "wb") as f:
+            f.write(data)
+        if aux is not None:
+            with open(image_path + ".aux.xml", "wb") as f:
+                f.write(aux)
+        return len(data), hashlib.sha1(data).hexdigest()
+
+    def read_chip(self, source, window):
+        """Read window as pixel-interleaved (height, width, bands) uint8 bytes
+
+        Returns None for rasters that are not 8 bit, rather than clamping
+        their pixels.
+        """
+        ds = self.open(source)
+        if ds is None or window is None or ds.GetRasterBand(1).DataType != gdal.GDT_Byte:
+            return None
+        xoff, yoff, xsize, ysize = window
+        bands = ds.RasterCount
+        return ds.ReadRaster(
+            xoff, yoff, xsize, ysize,
+            buf_type=gdal.GDT_Byte,
+            buf_pixel_space=bands,
+            buf_line_space=bands * xsize,
+            buf_band_space=1
+        )
+
+    def process(self, source, projwin, image_path, window=None, output="file"):
+        """Handle one tile according to output
+
+        "file" cuts it to image_path, "encoded" returns the encoded image
+        bytes and "raw" returns the pixels from read_chip.
+        """
+        if output == "file":
+            return self.cut(source, projwin, image_path, window)
+        if output == "raw":
+            return self.read_chip(source, window)
+        encoded = self.encode_tile(source, projwin, window)
+        return encoded[0] if encoded else None
+
+
+class ValidPixelScreen:
+    """Valid-pixel fraction of tiles, read from a raster's overviews
+
+    The whole raster is read once into a buffer about min_pixels_per_tile
+    pixels per tile wide, which GDAL serves from the coarsest overview that
+    is fine enough (or by decimating when there are none). Valid pixels are
+    summed into an integral image, so the fraction for any number of tiles
+    is a single vectorized NumPy lookup. Full-resolution data is never read
+    when the raster has overviews.
+
+    A pixel is invalid where an alpha band is 0, where every band equals
+    its nodata value, or where every band is 0 if no nodata is set (the
+    black border of a mosaic).
+    """
+
+    def __init__(self, source, tile_size_pixel=256, min_pixels_per_tile=4):
+        ds = gdal.Open(source, gdal.GA_ReadOnly)
+        if ds is None:
+            raise IOError(f"Could not open raster {source}")
+        self.geotransform = ds.GetGeoTransform()
+        factor = max(1, tile_size_pixel // max(1, min_pixels_per_tile))
+        width = max(1, ds.RasterXSize // factor)
+        height = max(1, ds.RasterYSize // factor)
+        self.scale_x = ds.RasterXSize / width
+        self.scale_y = ds.RasterYSize / height
+        valid = self._valid_mask(ds, width, height)
+        # summed-area table with a leading zero row and column
+        self.integral = np.zeros((height + 1, width + 1), dtype=np.int64)
+        self.integral[1:, 1:] = valid.cumsum(axis=0).cumsum(axis=1)
+
+    @staticmethod
+    def _valid_mask(ds, width, height):
+        valid = None
+        any_set = np.zeros((height, width), dtype=bool)
+        all_nodata = np.ones((height, width), dtype=bool)
+        has_nodata = False
+        for i in range(1, ds.RasterCount + 1):
+            band = ds.GetRasterBand(i)
+            data = band.ReadAsArray(0, 0, ds.RasterXSize, ds.RasterYSize, width, height)
+            if band.GetColorInterpretation() == gdal.GCI_AlphaBand:
+                valid = data > 0 if valid is None else valid & (data > 0)
+                continue
+            nodata = band.GetNoDataValue()
+            if nodata is not None:
+                has_nodata = True
+                all_nodata &= data == nodata
+            any_set |= data != 0
+        data_valid = ~all_nodata if has_nodata else any_set
+        return data_valid if valid is None else valid & data_valid
+
+    def fractions(self, windows):
+        """Valid fraction of each full-resolution (xoff, yoff, xsize, ysize) window"""
+        w = np.asarray(windows, dtype=np.float64).reshape(-1, 4)
+        rows, cols = self.integral.shape[0] - 1, self.integral.shape[1] - 1
+        x0 = np.clip(np.floor(w[:, 0] / self.scale_x).astype(np.int64), 0, cols)
+        y0 = np.clip(np.floor(w[:, 1] / self.scale_y).astype(np.int64), 0, rows)
+        x1 = np.clip(np.ceil((w[:, 0] + w[:, 2]) / self.scale_x).astype(np.int64), 0, cols)
+        y1 = np.clip(np.ceil((w[:, 1] + w[:, 3]) / self.scale_y).astype(np.int64), 0, rows)
+        area = (x1 - x0) * (y1 - y0)
+        integral = self.integral
+        sums = integral[y1, x1] - integral[y0, x1] - integral[y1, x0] + integral[y0, x0]
+        return np.where(area > 0, sums / np.maximum(area, 1), 0.0)
+
+    def window_for_bounds(self, xmin, ymin, xmax, ymax):
+        """Full-resolution pixel window of map bounds in the raster CRS"""
+        gt = self.geotransform
+        xoff = (xmin - gt[0]) / gt[1]
+        yoff = (ymax - gt[3]) / gt[5]
+        return xoff, yoff, (xmax - xmin) / gt[1], (ymin - ymax) / gt[5]
+
+
+def snap_window(geotransform, raster_size, center_x, center_y, box_size_pixel):
+    """Pixel window of box_size_pixel centred on a point, on the raster grid
+
+    Returns (xoff, yoff, xsize, ysize) with integer offsets, shifted to stay
+    inside the raster, or None for rotated rasters or boxes larger than the
+    raster.
+    """
+    gt = geotransform
+    width, height = raster_size
+    if gt[2] != 0 or gt[4] != 0 or box_size_pixel > width or box_size_pixel > height:
+        return None
+    col = (center_x - gt[0]) / gt[1]
+    row = (center_y - gt[3]) / gt[5]
+    xoff = int(round(col - box_size_pixel / 2))
+    yoff = int(round(row - box_size_pixel / 2))
+    xoff = min(max(xoff, 0), width - box_size_pixel)
+    yoff = min(max(yoff, 0), height - box_size_pixel)
+    return xoff, yoff, box_size_pixel, box_size_pixel
+
+
+def blocks_touched(window, block_size):
+    """Number of internal raster blocks a pixel window has to decode"""
+    xoff, yoff, xsize, ysize = window
+    block_x, block_y = block_size
+    cols = (xoff + xsize - 1) // block_x - xoff // block_x + 1
+    rows = (yoff + ysize - 1) // block_y - yoff // block_y + 1
+    return cols * rows
+
+
+def hilbert_index(x, y, order=16):
+    """Distance of integer cell (x, y) along a Hilbert curve of 2**order cells"""
+    n = 1 << order
+    d = 0
+    s = n >> 1
+    while s > 0:
+        rx = 1 if x & s else 0
+        ry = 1 if y & s else 0
+        d += s * s * ((3 * rx) ^ ry)
+        if ry == 0:
+            if rx == 1:
+                x = n - 1 - x
+                y = n - 1 - y
+            x, y = y, x
+        s >>= 1
+    return d
+
+
+def zorder_index(x, y, order=16):
+    """Morton (Z-order) code of integer cell (x, y), interleaving the bits"""
+    d = 0
+    for bit in range(order):
+        d |= ((x >> bit) & 1) << (2 * bit)
+        d |= ((y >> bit) & 1) << (2 * bit + 1)
+    return d
+
+
+CURVES = {"hilbert": hilbert_index, "zorder": zorder_index}
+
+
+def curve_index(curve, x, y, extent, order=16):
+    """Position of map point (x, y) along a space-filling curve over extent
+
+    extent is (xmin, ymin, xmax, ymax); curve is "hilbert" or "zorder".
+    """
+    xmin, ymin, xmax, ymax = extent
+    cells = (1 << order) - 1
+    gx = int((x - xmin) / (xmax - xmin) * cells) if xmax > xmin else 0
+    gy = int((y - ymin) / (ymax - ymin) * cells) if ymax > ymin else 0
+    gx = min(max(gx, 0), cells)
+    gy = min(max(gy, 0), cells)
+    return CURVES[curve](gx, gy, order)
+
+
+SPLITS = ("train", "val", "test")
+
+
+def spatial_split(x, y, class_ids, block_size, fractions=(0.8, 0.1, 0.1), seed=0):
+    """Assign tiles to train/val/test by spatial block, stratified by class
+
+    Tiles are binned into block_size squares by their centres (x, y) and
+    every block goes to a single split, so neighbouring, autocorrelated
+    tiles never end up on both sides of a split. Blocks are grouped by
+    their most common class; each group is shuffled with seed and cut at
+    the cumulative fractions of its tile count, which keeps every class
+    close to fractions in every split. Returns an index into SPLITS per
+    tile.
+    """
+    x = np.asarray(x, dtype=np.float64)
+    y = np.asarray(y, dtype=np.float64)
+    class_ids = np.asarray(class_ids, dtype=np.int64)
+    if len(x) == 0:
+        return np.zeros(0, dtype=np.int8)
+    cells = np.stack([np.floor(x / block_size), np.floor(y / block_size)], axis=1).astype(np.int64)
+    _, block = np.unique(cells, axis=0, return_inverse=True)
+    block = block.reshape(-1)
+    n_blocks = int(block.max()) + 1
+
+    # most common class of each block, ties going to the lower class id
+    pairs, counts = np.unique(np.stack([block, class_ids], axis=1), axis=0, return_counts=True)
+    pairs = pairs[np.lexsort((-counts, pairs[:, 0]))]
+    first = np.ones(len(pairs), dtype=bool)
+    first[1:] = pairs[1:, 0] != pairs[:-1, 0]
+    dominant = np.empty(n_blocks, dtype=np.int64)
+    dominant[pairs[first, 0]] = pairs[first, 1]
+
+    # shuffle the blocks, then group them by class keeping the shuffled order
+    order = np.random.default_rng(seed).permutation(n_blocks)
+    order = order[np.argsort(dominant[order], kind="stable")]
+    sizes = np.bincount(block, minlength=n_blocks)[order]
+    groups = dominant[order]
+    starts = np.flatnonzero(np.r_[True, groups[1:] != groups[:-1]])
+    group_of = np.repeat(np.arange(len(starts)), np.diff(np.r_[starts, n_blocks]))
+    totals = np.add.reduceat(sizes, starts)
+    ends = np.cumsum(sizes)
+    offsets = (ends - sizes)[starts]
+    # place each block by the middle of its tile range within its group
+    position = (ends - sizes / 2.0 - offsets[group_of]) / totals[group_of]
+    cuts = np.cumsum(np.asarray(fractions, dtype=np.float64) / np.sum(fractions))[:-1]
+    block_split = np.empty(n_blocks, dtype=np.int8)
+    block_split[order] = np.searchsorted(cuts, position, side="right")
+    return block_split[block]
+
+
+def _read_vsimem(path):
+    """Return the contents of a /vsimem file and unlink it, or None"""
+    if gdal.VSIStatL(path) is None:
+        return None
+    f = gdal.VSIFOpenL(path, "rb")
+    try:
+        gdal.VSIFSeekL(f, 0, 2)
+        size = gdal.VSIFTellL(f)
+        gdal.VSIFSeekL(f, 0, 0)
+        data = gdal.VSIFReadL(1, size, f)
+    finally:
+        gdal.VSIFCloseL(f)
+    gdal.Unlink(path)
+    return data
+
+
+# per-process cutter used by pool workers, created by _init_worker
+_worker_cutter = None
+
+
+def _init_worker(driver, creation_options):
+    global _worker_cutter
+    _worker_cutter = TileCutter(driver, creation_options)
+
+
+def _cut_batch(source, batch, output):
+    return [
+        _worker_cutter.process(source, projwin, image_path, window, output)
+        for projwin, image_path, window in batch
+    ]
+
+
+def _python_executable():
+    """Interpreter used to spawn workers
+
+    Inside QGIS sys.executable can be the QGIS binary rather than python, in
+    which case the python next to it is used instead.
+    """
+    if os.path.basename(sys.executable).lower().startswith("python"):
+        return sys.executable
+    names = ("python.exe", "python3.exe") if os.name == "nt" else ("python3", "python")
+    for folder in (sys.exec_prefix, os.path.join(sys.exec_prefix, "bin"), os.path.dirname(sys.executable)):
+        for name in names:
+            path = os.path.join(folder, name)
+            if os.path.isfile(path):
+                return path
+    return sys.executable
+
+
+def cut_tiles(tiles, workers=1, chunk_size=256, driver="JPEG", creation_options=None, callback=None,
+              output="file", is_canceled=None):
+    """Cut a list of (source, projwin, image_path, window) tiles
+
+    With workers > 1 runs of consecutive tiles of one source raster are
+    dispatched in chunks to a process pool; every worker keeps its own
+    pinned datasets. Each tile's output only depends on its own inputs and
+    callbacks come in the order of tiles, so the output is the same
+    whatever the worker count. Returns the TileCutter.cut results in the
+    order of tiles. With output "encoded" or "raw" the encoded image or raw
+    pixel bytes are returned instead (see TileCutter.process); nothing is
+    written and image_path is ignored.
+
+    callback(index, result) is called in the main process for each tile,
+    in the order of tiles. is_canceled() is checked between tiles (between
+    chunks on a pool); once it returns True no more tiles are started and
+    the tiles not cut are left as None.
+    """
+    if workers <= 1 or len(tiles) <= chunk_size:
+        results = [None] * len(tiles)
+        with TileCutter(driver, creation_options) as cutter:
+            for i, (source, projwin, image_path, window) in enumerate(tiles):
+                if is_canceled and is_canceled():
+                    break
+                results[i] = cutter.process(source, projwin, image_path, window, output)
+                if callback:
+                    callback(i, results[i])
+        return results
+
+    # chunks follow the input order, so results are consumed in that order
+    chunks = []
+    for i, (source, _, _, _) in enumerate(tiles):
+        if chunks and chunks[-1][0] == source and len(chunks[-1][1]) < chunk_size:
+            chunks[-1][1].append(i)
+        else:
+            chunks.append((source, [i]))
+    context = multiprocessing.get_context("spawn")
+    # the spawn executable is process wide, so it is only swapped for the
+    # life of this pool and put back for other plugins afterwards
+    previous = multiprocessing.spawn.get_executable()
+    executable = _python_executable()
+    if executable != previous:
+        context.set_executable(executable)
+    results = [None] * len(tiles)
+    try:
+        with ProcessPoolExecutor(
+            max_workers=workers,
+            mp_context=context,
+            initializer=_init_worker,
+            initargs=(driver, creation_options)
+        ) as pool:
+            futures = []
+            for source, chunk in chunks:
+                batch = [tiles[i][1:] for i in chunk]
+                futures.append((chunk, pool.submit(_cut_batch, source, batch, output)))
+            for n, (chunk, future) in enumerate(futures):
+                if is_canceled and is_canceled():
+                    for _, pending in futures[n:]:
+                        pending.cancel()
+                    break
+                for i, result in zip(chunk, future.result()):
+                    results[i] = result
+                    if callback:
+                        callback(i, result)
+    finally:
+        if executable != previous:
+            context.set_executable(previous)
+    return results
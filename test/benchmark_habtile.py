@@ -0,0 +1,309 @@
+# coding=utf-8
+"""HabTile benchmarks.
+
+Synthesises tiled, compressed GeoTIFF mosaics with overviews and habitat
+layers of a given size, then times the click path, habitat layer setup,
+symbology, layer saving and the YOLO export. Run from the plugin directory
+inside a QGIS python environment::
+
+    python test/benchmark_habtile.py --features 1000 10000 100000 --output results.json
+
+Inputs are generated from a fixed seed, so runs of different plugin
+versions on the same machine are comparable. Results are printed and, with
+--output, written as JSON together with the plugin, QGIS and GDAL versions.
+
+.. note:: This program is free software; you can redistribute it and/or modify
+     it under the terms of the GNU General Public License as published by
+     the Free Software Foundation; either version 2 of the License, or
+     (at your option) any later version.
+
+"""
+
+__author__ = 'nick.mortimer@csiro.au'
+__date__ = '2025-07-18'
+__copyright__ = 'Copyright 2025, Nicolas Mortimer'
+
+import argparse
+import configparser
+import importlib
+import json
+import os
+import platform
+import random
+import shutil
+import sys
+import tempfile
+import time
+from datetime import datetime
+
+PLUGIN_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, os.path.dirname(PLUGIN_DIR))
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from utilities import get_qgis_app
+QGIS_APP, CANVAS, IFACE, PARENT = get_qgis_app()
+
+import numpy as np
+from osgeo import gdal
+from qgis.core import (
+    Qgis, QgsCoordinateReferenceSystem, QgsFeature, QgsField, QgsGeometry, QgsPointXY, QgsProject,
+    QgsRasterLayer, QgsRectangle, QgsVectorFileWriter, QgsVectorLayer
+)
+
+# import the plugin as a package so the export can load its sibling modules
+habtile = importlib.import_module(os.path.basename(PLUGIN_DIR) + '.habtile')
+HabTile, TileIndex = habtile.HabTile, habtile.TileIndex
+
+CRS = 'EPSG:32750'
+HABITATS = ['Seagrass', 'Sand', 'Reef', 'Macroalgae', 'Rubble', 'Sponge garden']
+
+
+def timed(func, repeat):
+    """Mean wall time of func() in milliseconds"""
+    start = time.perf_counter()
+    for _ in range(repeat):
+        func()
+    return (time.perf_counter() - start) * 1000.0 / repeat
+
+
+def make_mosaic(path, size, bands=3, block=256, seed=0):
+    """Write a tiled, DEFLATE compressed GeoTIFF of size x size pixels with overviews
+
+    The pixels are a gradient with noise, so the file compresses like
+    imagery rather than like a constant raster, and a zero collar covers
+    the outer 5% like the border of a real mosaic.
+    """
+    driver = gdal.GetDriverByName('GTiff')
+    ds = driver.Create(path, size, size, bands, gdal.GDT_Byte, [
+        'TILED=YES', f'BLOCKXSIZE={block}', f'BLOCKYSIZE={block}', 'COMPRESS=DEFLATE', 'BIGTIFF=IF_SAFER'
+    ])
+    ds.SetGeoTransform((400000.0, 0.01, 0.0, 7500000.0, 0.0, -0.01))
+    ds.SetProjection(QgsCoordinateReferenceSystem(CRS).toWkt())
+    rng = np.random.default_rng(seed)
+    border = size // 20
+    cols = np.arange(size)
+    for yoff in range(0, size, block):
+        rows = np.arange(yoff, min(yoff + block, size))[:, None]
+        collar = (rows[:, 0] < border) | (rows[:, 0] >= size - border)
+        for b in range(1, bands + 1):
+            data = ((rows + cols * b) * 255 // (2 * size)).astype(np.uint8)
+            data += rng.integers(0, 16, data.shape, dtype=np.uint8)
+            data[:, :border] = 0
+            data[:, size - border:] = 0
+            data[collar] = 0
+            ds.GetRasterBand(b).WriteArray(data, 0, yoff)
+    levels = []
+    factor = 2
+    while size // factor >= block:
+        levels.append(factor)
+        factor *= 2
+    ds.BuildOverviews('AVERAGE', levels)
+    ds = None
+
+
+def make_habitat_layer(count, raster, box_size_pixel=256, seed=0):
+    """Memory habitat layer of count random tiles inside raster"""
+    layer = QgsVectorLayer(f'Polygon?crs={CRS}', f'habitat_{raster.name()}'.lower(), 'memory')
+    fields = []
+    for name, qtype, length in habtile.HABITAT_LAYER_FIELDS:
+        fields.append(QgsField(name, qtype, len=length) if length else QgsField(name, qtype))
+    layer.dataProvider().addAttributes(fields)
+    layer.updateFields()
+    rng = random.Random(seed)
+    pixel = raster.rasterUnitsPerPixelX()
+    half = box_size_pixel * pixel / 2
+    extent = raster.extent()
+    features = []
+    for i in range(count):
+        x = rng.uniform(extent.xMinimum() + half, extent.xMaximum() - half)
+        y = rng.uniform(extent.yMinimum() + half, extent.yMaximum() - half)
+        feature = QgsFeature(layer.fields())
+        feature.setGeometry(QgsGeometry.fromRect(QgsRectangle(x - half, y - half, x + half, y + half)))
+        for n, habitat in enumerate(rng.sample(HABITATS, rng.randint(1, 3)), start=1):
+            feature[f'habitat_{n}'] = habitat
+        feature['source_raster'] = raster.name()
+        feature['pixel_size'] = pixel
+        feature['tile_id'] = f'{raster.name()}_{i}'
+        feature['box_size_m'] = 2 * half
+        feature['box_size_pixel'] = box_size_pixel
+        feature['center_x'] = x
+        feature['center_y'] = y
+        features.append(feature)
+    layer.dataProvider().addFeatures(features)
+    return layer
+
+
+def select_raster(tool, raster):
+    """Make raster the tool's selected raster, as if it were active in the legend"""
+    info = (raster.rasterUnitsPerPixelX(), raster.name(), raster.crs(), raster)
+    tool.get_selected_raster_info = lambda: info
+
+
+def bench_click_latency(repeat=2000):
+    """Click-to-feature latency with cold and cached coordinate transforms
+
+    The cold case clears the transform cache before every click, which is
+    what canvasPressEvent cost when it built both transforms per click.
+    """
+    CANVAS.setDestinationCrs(QgsCoordinateReferenceSystem('EPSG:4326'))
+    raster_crs = QgsCoordinateReferenceSystem(CRS)
+    tool = HabTile(CANVAS)
+    point = QgsPointXY(113.77, -22.57)
+
+    def click():
+        raster_point = tool.get_transforms(raster_crs)[0].transform(point)
+        geometry, box_size_m = tool.tile_geometry(raster_point, 0.01, raster_crs)
+        feature = QgsFeature()
+        feature.setGeometry(geometry)
+
+    def cold_click():
+        tool.clear_transform_cache()
+        click()
+
+    results = {
+        'click_cold_ms': timed(cold_click, repeat),
+        'click_cached_ms': timed(click, repeat),
+    }
+    tool.disconnect_signals()
+    return results
+
+
+def bench_overlap_lookup(layer, repeat=2000):
+    """Duplicate-tile index build and lookup on click against layer"""
+    start = time.perf_counter()
+    index = TileIndex(layer)
+    build_ms = (time.perf_counter() - start) * 1000.0
+    probe = next(layer.getFeatures()).geometry()
+    lookup_ms = timed(lambda: index.overlapping(probe, 0.5), repeat)
+    index.disconnect()
+    return {'overlap_index_build_ms': build_ms, 'overlap_lookup_ms': lookup_ms}
+
+
+def bench_setup_habitat_layer(raster, repeat=200):
+    """Habitat layer resolution for a click, with a cold and a warm layer cache"""
+    tool = HabTile(CANVAS)
+    select_raster(tool, raster)
+
+    def cold():
+        tool.clear_layer_cache()
+        tool.setup_habitat_layer()
+
+    results = {
+        'setup_habitat_layer_cold_ms': timed(cold, repeat),
+        'setup_habitat_layer_cached_ms': timed(tool.setup_habitat_layer, repeat),
+    }
+    tool.disconnect_signals()
+    return results
+
+
+def bench_symbology(layer, repeat=20):
+    """Categorised renderer setup on layer"""
+    tool = HabTile(CANVAS, layer)
+    results = {'set_symbology_ms': timed(tool.set_symbology, repeat)}
+    tool.disconnect_signals()
+    return results
+
+
+def bench_save_layer(layer, work_dir):
+    """Write layer to a GeoPackage, as saving a scratch layer does"""
+    path = os.path.join(work_dir, f'{layer.name()}_{layer.featureCount()}.gpkg')
+    options = QgsVectorFileWriter.SaveVectorOptions()
+    options.driverName = 'GPKG'
+    start = time.perf_counter()
+    error = QgsVectorFileWriter.writeAsVectorFormatV3(
+        layer, path, QgsProject.instance().transformContext(), options
+    )
+    elapsed = (time.perf_counter() - start) * 1000.0
+    if error[0] != QgsVectorFileWriter.NoError:
+        raise RuntimeError(f'Could not save {path}: {error[1]}')
+    return {'save_layer_ms': elapsed, 'save_layer_mb': os.path.getsize(path) / 1e6}
+
+
+def bench_export(layer, raster_dir, work_dir, workers):
+    """A full export_to_yolo run of layer, then an incremental rerun"""
+    output_dir = os.path.join(work_dir, f'export_{layer.featureCount()}')
+    start = time.perf_counter()
+    summary = habtile.export_to_yolo(layer, output_dir, [raster_dir], workers=workers)
+    full_ms = (time.perf_counter() - start) * 1000.0
+    start = time.perf_counter()
+    habtile.export_to_yolo(layer, output_dir, [raster_dir], workers=workers)
+    rerun_ms = (time.perf_counter() - start) * 1000.0
+    return {
+        'export_ms': full_ms,
+        'export_rerun_ms': rerun_ms,
+        'export_tiles_per_second': summary['tiles_per_second'],
+        'export_mb_read': summary['mb_read'],
+        'export_mb_written': summary['mb_written'],
+        'export_stage_seconds': summary['stage_seconds'],
+    }
+
+
+def environment():
+    """Versions and machine details stored with the results"""
+    metadata = configparser.ConfigParser()
+    metadata.read(os.path.join(PLUGIN_DIR, 'metadata.txt'))
+    return {
+        'plugin_version': metadata.get('general', 'version', fallback=None),
+        'qgis_version': Qgis.QGIS_VERSION,
+        'gdal_version': gdal.__version__,
+        'python_version': platform.python_version(),
+        'machine': platform.platform(),
+        'cpu_count': os.cpu_count(),
+        'timestamp': datetime.now().isoformat(timespec='seconds'),
+    }
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='HabTile benchmarks')
+    parser.add_argument('--features', type=int, nargs='+', default=[1000, 10000],
+                        help='habitat layer sizes to benchmark')
+    parser.add_argument('--raster-size', type=int, default=8192, help='mosaic width and height in pixels')
+    parser.add_argument('--export-features', type=int, default=10000,
+                        help='largest layer size to export, as every tile is cut')
+    parser.add_argument('--workers', type=int, default=1, help='export worker processes')
+    parser.add_argument('--output', help='write the results to this JSON file')
+    parser.add_argument('--keep', action='store_true', help='keep the generated data')
+    args = parser.parse_args(argv)
+
+    work_dir = tempfile.mkdtemp(prefix='habtile_bench_')
+    QgsProject.instance().setPresetHomePath(work_dir)
+    raster_dir = os.path.join(work_dir, 'rasters')
+    os.makedirs(raster_dir)
+    results = {'environment': environment(), 'parameters': vars(args), 'runs': []}
+    try:
+        start = time.perf_counter()
+        raster_path = os.path.join(raster_dir, 'mosaic.tif')
+        make_mosaic(raster_path, args.raster_size)
+        results['mosaic_ms'] = (time.perf_counter() - start) * 1000.0
+        raster = QgsRasterLayer(raster_path, 'mosaic', 'gdal')
+        QgsProject.instance().addMapLayer(raster)
+        results.update(bench_click_latency())
+
+        for count in args.features:
+            layer = make_habitat_layer(count, raster)
+            QgsProject.instance().addMapLayer(layer)
+            run = {'features': count}
+            run.update(bench_overlap_lookup(layer))
+            run.update(bench_setup_habitat_layer(raster))
+            run.update(bench_symbology(layer))
+            run.update(bench_save_layer(layer, work_dir))
+            if count <= args.export_features:
+                run.update(bench_export(layer, raster_dir, work_dir, args.workers))
+            QgsProject.instance().removeMapLayer(layer.id())
+            results['runs'].append(run)
+            print(json.dumps(run))
+    finally:
+        QgsProject.instance().removeAllMapLayers()
+        if not args.keep:
+            shutil.rmtree(work_dir, ignore_errors=True)
+
+    for name, value in results.items():
+        if isinstance(value, float):
+            print(f"{name}: {value:.4f}")
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(results, f, indent=1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,70 @@
+# coding=utf-8
+"""Chip store tests.
+
+.. note:: This program is free software; you can redistribute it and/or modify
+     it under the terms of the GNU General Public License as published by
+     the Free Software Foundation; either version 2 of the License, or
+     (at your option) any later version.
+
+"""
+
+__author__ = 'nick.mortimer@csiro.au'
+__date__ = '2025-07-18'
+__copyright__ = 'Copyright 2025, Nicolas Mortimer'
+
+import shutil
+import tempfile
+import unittest
+
+import numpy as np
+
+from habtile_chips import ChipStoreWriter, ChipStore
+
+
+class HabTileChipsTest(unittest.TestCase):
+    """Test chips round trip through the memory-mapped store."""
+
+    def setUp(self):
+        """Runs before each test."""
+        self.output_dir = tempfile.mkdtemp()
+
+    def tearDown(self):
+        """Runs after each test."""
+        shutil.rmtree(self.output_dir)
+
+    def write_store(self, shapes):
+        chips = [np.full(shape, i + 1, dtype=np.uint8) for i, shape in enumerate(shapes)]
+        writer = ChipStoreWriter(
+            self.output_dir, shapes, list(range(len(shapes))), [f"tile_{i}" for i in range(len(shapes))]
+        )
+        # leave the last chip unwritten, as for a failed read
+        for i, chip in enumerate(chips[:-1]):
+            writer.write(i, chip.tobytes())
+        writer.close()
+        return chips
+
+    def test_uniform_chips(self):
+        """Chips of one size are stored as a 4D array."""
+        chips = self.write_store([(4, 4, 3)] * 3)
+        store = ChipStore(self.output_dir)
+        self.assertEqual(store.array.shape, (3, 4, 4, 3))
+        self.assertEqual(len(store), 3)
+        np.testing.assert_array_equal(store[1], chips[1])
+        self.assertEqual(list(store.valid), [True, True, False])
+        self.assertEqual(store.tile_ids[2], "tile_2")
+
+    def test_mixed_chips(self):
+        """Chips of different sizes are stored flat with offsets."""
+        chips = self.write_store([(2, 2, 3), (4, 4, 3), (2, 2, 1)])
+        store = ChipStore(self.output_dir)
+        self.assertEqual(store.array.ndim, 1)
+        np.testing.assert_array_equal(store[0], chips[0])
+        np.testing.assert_array_equal(store[1], chips[1])
+        self.assertEqual(store[2].shape, (2, 2, 1))
+        self.assertEqual(list(store.class_ids), [0, 1, 2])
+
+
+if __name__ == "__main__":
+    suite = unittest.makeSuite(HabTileChipsTest)
+    runner = unittest.TextTestRunner(verbosity=2)
+    runner.run(suite)
@@ -0,0 +1,252 @@
+# coding=utf-8
+"""YOLO export bookkeeping tests.
+
+.. note:: This program is free software; you can redistribute it and/or modify
+     it under the terms of the GNU General Public License as published by
+     the Free Software Foundation; either version 2 of the License, or
+     (at your option) any later version.
+
+"""
+
+__author__ = 'nick.mortimer@csiro.au'
+__date__ = '2025-07-18'
+__copyright__ = 'Copyright 2025, Nicolas Mortimer'
+
+import importlib
+import json
+import os
+import shutil
+import sys
+import tarfile
+import tempfile
+import unittest
+
+# import habtile as part of the plugin package, so it can load its sibling modules
+PLUGIN_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, os.path.dirname(PLUGIN_DIR))
+habtile = importlib.import_module(os.path.basename(PLUGIN_DIR) + '.habtile')
+ExportManifest = habtile.ExportManifest
+ClassRegistry = habtile.ClassRegistry
+TarShardWriter = habtile.TarShardWriter
+habitat_statistics = habtile.habitat_statistics
+
+
+class HabTileExportManifestTest(unittest.TestCase):
+    """Test the manifest that makes exports incremental."""
+
+    def setUp(self):
+        """Runs before each test."""
+        self.output_dir = tempfile.mkdtemp()
+
+    def tearDown(self):
+        """Runs after each test."""
+        shutil.rmtree(self.output_dir)
+
+    def entry(self, tile_id, habitat="Reef", class_id=0):
+        return {
+            "geometry": f"geometry_{tile_id}",
+            "attributes": ExportManifest.attribute_hash(habitat, class_id),
+            "source_raster": "/data/mosaic.tif",
+            "raster_mtime": 1.0,
+            "image": os.path.join("images", f"{tile_id}.jpg"),
+            "label": os.path.join("labels", f"{tile_id}.txt"),
+        }
+
+    def write_tile(self, manifest, tile_id, **kwargs):
+        """Write the files of tile_id and record them as a finished export would"""
+        entry = self.entry(tile_id, **kwargs)
+        for key in ("image", "label"):
+            path = os.path.join(self.output_dir, entry[key])
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            with open(path, "w") as f:
+                f.write(tile_id)
+        entry["checksum"] = "checksum"
+        manifest.update(tile_id, entry)
+
+    def test_unchanged_tile(self):
+        """A tile with the same geometry, raster and class is skipped."""
+        manifest = ExportManifest(self.output_dir)
+        self.write_tile(manifest, "a")
+        manifest.save()
+        manifest = ExportManifest(self.output_dir)
+        self.assertTrue(manifest.image_current("a", self.entry("a")))
+        self.assertTrue(manifest.label_current("a", self.entry("a")))
+        self.assertFalse(manifest.image_current("b", self.entry("b")))
+
+    def test_changed_class(self):
+        """A changed class keeps the image and rewrites only the label."""
+        manifest = ExportManifest(self.output_dir)
+        self.write_tile(manifest, "a")
+        entry = self.entry("a", habitat="Seagrass", class_id=1)
+        self.assertTrue(manifest.image_current("a", entry))
+        self.assertFalse(manifest.label_current("a", entry))
+        moved = dict(entry, geometry="moved")
+        self.assertFalse(manifest.image_current("a", moved))
+
+    def test_move_image(self):
+        """A tile that changed split is moved rather than cut again."""
+        manifest = ExportManifest(self.output_dir)
+        self.write_tile(manifest, "a")
+        image = os.path.join("images", "val", "a.jpg")
+        self.assertTrue(manifest.move_image("a", image))
+        self.assertTrue(os.path.isfile(os.path.join(self.output_dir, image)))
+        self.assertTrue(manifest.image_current("a", dict(self.entry("a"), image=image)))
+        self.assertFalse(manifest.move_image("a", image))
+
+    def test_remove_orphans(self):
+        """Only tiles that are not kept lose their files."""
+        manifest = ExportManifest(self.output_dir)
+        for tile_id in ("a", "b", "c"):
+            self.write_tile(manifest, tile_id)
+        # "b" was not planned this time (e.g. its raster is not loaded) but is still in the layer
+        self.assertEqual(manifest.remove_orphans(["a", "b"]), 1)
+        self.assertEqual(sorted(manifest.tiles), ["a", "b"])
+        for tile_id, exists in (("a", True), ("b", True), ("c", False)):
+            for folder, suffix in (("images", "jpg"), ("labels", "txt")):
+                path = os.path.join(self.output_dir, folder, f"{tile_id}.{suffix}")
+                self.assertEqual(os.path.exists(path), exists)
+
+    def test_lost_habitat(self):
+        """Cleared tiles lose their files; tiles whose raster is not found keep them."""
+
+        class Resolver:
+            def resolve(self, name):
+                return None
+
+        class Snapshot:
+            crs = None
+            transform_context = None
+            records = [
+                habtile.TileRecord(1, "cleared", "", "mosaic", None, []),
+                habtile.TileRecord(2, "elsewhere", "Reef", "not_loaded", None, []),
+            ]
+
+        manifest = ExportManifest(self.output_dir)
+        for tile_id in ("cleared", "elsewhere"):
+            self.write_tile(manifest, tile_id)
+        planned, unresolved = habtile.plan_tiles(Snapshot(), Resolver(), ClassRegistry(self.output_dir))
+        self.assertEqual((planned, unresolved), ([], ["elsewhere"]))
+        manifest.remove_orphans([tile.rec.tile_id for tile in planned] + unresolved)
+        self.assertEqual(list(manifest.tiles), ["elsewhere"])
+        self.assertFalse(os.path.exists(os.path.join(self.output_dir, "labels", "cleared.txt")))
+
+
+class HabTileClassRegistryTest(unittest.TestCase):
+    """Test class ids stay stable between exports."""
+
+    def setUp(self):
+        """Runs before each test."""
+        self.output_dir = tempfile.mkdtemp()
+
+    def tearDown(self):
+        """Runs after each test."""
+        shutil.rmtree(self.output_dir)
+
+    def test_stable_ids(self):
+        """Existing ids are kept and new classes are appended sorted."""
+        registry = ClassRegistry(self.output_dir)
+        self.assertEqual(registry.add(["Sand", "Reef", "Sand"]), 2)
+        registry.save()
+        registry = ClassRegistry(self.output_dir)
+        self.assertEqual(registry.add(["Seagrass", "Algae", "Reef"]), 2)
+        self.assertEqual(registry.names, ["Reef", "Sand", "Algae", "Seagrass"])
+        self.assertEqual(registry["Sand"], 1)
+        self.assertNotIn("Mud", registry)
+
+    def test_seed_from_classes_txt(self):
+        """An older export's classes.txt keeps its ids."""
+        with open(os.path.join(self.output_dir, "classes.txt"), "w") as f:
+            f.write("Sand\nReef")
+        registry = ClassRegistry(self.output_dir)
+        registry.add(["Algae", "Reef"])
+        self.assertEqual(registry.names, ["Sand", "Reef", "Algae"])
+
+    def test_corrupt_registry(self):
+        """An unreadable classes.json falls back to classes.txt."""
+        with open(os.path.join(self.output_dir, "classes.txt"), "w") as f:
+            f.write("Sand\nReef")
+        with open(os.path.join(self.output_dir, ClassRegistry.FILENAME), "w") as f:
+            f.write("{not json")
+        self.assertEqual(ClassRegistry(self.output_dir).names, ["Sand", "Reef"])
+
+
+class HabTileTarShardTest(unittest.TestCase):
+    """Test samples streamed into tar shards."""
+
+    def setUp(self):
+        """Runs before each test."""
+        self.output_dir = tempfile.mkdtemp()
+
+    def tearDown(self):
+        """Runs after each test."""
+        shutil.rmtree(self.output_dir)
+
+    def test_shards(self):
+        """Shards roll over at max_bytes and the index points at every sample."""
+        tile_ids = ["mosaic.a", "m" * 150, "mosaic.c"]
+        writer = TarShardWriter(self.output_dir, max_bytes=6 * tarfile.BLOCKSIZE)
+        for tile_id in tile_ids:
+            writer.add(tile_id, [("jpg", b"x" * 600), ("txt", b"0 0.5 0.5 1.0 1.0\n")])
+        writer.close()
+
+        shards_dir = os.path.join(self.output_dir, "shards")
+        with open(os.path.join(shards_dir, TarShardWriter.INDEX_NAME)) as f:
+            index = json.load(f)
+        self.assertEqual([shard["samples"] for shard in index["shards"]], [1, 1, 1])
+        for tile_id in tile_ids:
+            sample = index["samples"][tile_id]
+            with open(os.path.join(shards_dir, sample["shard"]), "rb") as f:
+                f.seek(sample["offset"])
+                with tarfile.open(fileobj=f, mode="r|") as tar:
+                    member = tar.next()
+                    self.assertEqual(member.name, f"{sample['key']}.jpg")
+                    self.assertEqual(tar.extractfile(member).read(), b"x" * 600)
+        self.assertEqual(index["samples"]["mosaic.a"]["key"], "mosaic_a")
+
+
+class HabTileStatisticsTest(unittest.TestCase):
+    """Test class statistics over read_columns style columns."""
+
+    COLUMNS = {
+        "habitat_1": ["Reef", "Reef", "Reef", "Sand"],
+        "habitat_2": ["Coral", "Coral", "Sand", None],
+        "habitat_3": [None, None, None, None],
+        "habitat_4": [None, None, None, None],
+        "source_raster": ["a.tif", "a.tif", "b.tif", "b.tif"],
+        "box_size_m": [10, 10, 20, 10],
+    }
+
+    def test_statistics(self):
+        """Classes, rasters and co-occurrence are counted per tile."""
+        stats = habitat_statistics(self.COLUMNS)
+        self.assertEqual(stats["tiles"], 4)
+        self.assertEqual(stats["area"], 700.0)
+        classes = {c["name"]: (c["count"], c["area"]) for c in stats["classes"]}
+        self.assertEqual(classes, {"Reef; Coral": (2, 200.0), "Reef; Sand": (1, 400.0), "Sand": (1, 100.0)})
+        self.assertEqual(stats["classes"][0]["name"], "Reef; Coral")
+        self.assertEqual(stats["levels"]["habitat_1"], {"Reef": 3, "Sand": 1})
+
+        rasters = {r["name"]: r for r in stats["rasters"]}
+        self.assertEqual((rasters["a.tif"]["count"], rasters["a.tif"]["area"]), (2, 200.0))
+        self.assertEqual(rasters["a.tif"]["classes"], {"Reef; Coral": 2})
+        self.assertEqual(rasters["b.tif"]["classes"], {"Reef; Sand": 1, "Sand": 1})
+
+        values = stats["cooccurrence"]["values"]
+        matrix = stats["cooccurrence"]["matrix"]
+        self.assertEqual(values, ["Coral", "Reef", "Sand"])
+        self.assertEqual([matrix[i][i] for i in range(3)], [2, 3, 2])
+        self.assertEqual(matrix, [list(row) for row in zip(*matrix)])
+        self.assertEqual(matrix[0][1], 2)
+        self.assertEqual(matrix[1][2], 1)
+        self.assertEqual(matrix[0][2], 0)
+
+
+if __name__ == "__main__":
+    suite = unittest.TestSuite([
+        unittest.makeSuite(HabTileExportManifestTest),
+        unittest.makeSuite(HabTileClassRegistryTest),
+        unittest.makeSuite(HabTileTarShardTest),
+        unittest.makeSuite(HabTileStatisticsTest),
+    ])
+    runner = unittest.TextTestRunner(verbosity=2)
+    runner.run(suite)
@@ -0,0 +1,88 @@
+# coding=utf-8
+"""Tile index tests.
+
+.. note:: This program is free software; you can redistribute it and/or modify
+     it under the terms of the GNU General Public License as published by
+     the Free Software Foundation; either version 2 of the License, or
+     (at your option) any later version.
+
+"""
+
+__author__ = 'nick.mortimer@csiro.au'
+__date__ = '2025-07-18'
+__copyright__ = 'Copyright 2025, Nicolas Mortimer'
+
+import unittest
+
+from qgis.core import QgsFeature, QgsGeometry, QgsRectangle, QgsVectorLayer
+
+from utilities import get_qgis_app
+QGIS_APP = get_qgis_app()
+
+from habtile import TileIndex
+
+
+def tile(x, y, size=10):
+    feature = QgsFeature()
+    feature.setGeometry(QgsGeometry.fromRect(QgsRectangle(x, y, x + size, y + size)))
+    return feature
+
+
+class HabTileTileIndexTest(unittest.TestCase):
+    """Test duplicate lookups follow edits to the habitat layer."""
+
+    def setUp(self):
+        """Runs before each test."""
+        self.layer = QgsVectorLayer("Polygon?crs=EPSG:3857", "habitat", "memory")
+        self.layer.dataProvider().addFeatures([tile(0, 0)])
+
+    def overlapping(self, index, x, y):
+        return [fid for fid, _ in index.overlapping(tile(x, y).geometry(), 0.5)]
+
+    def test_edit_buffer(self):
+        """Tiles added in the edit buffer are found without a rebuild."""
+        index = TileIndex(self.layer)
+        self.layer.startEditing()
+        self.layer.addFeature(tile(100, 100))
+        self.assertEqual(len(self.overlapping(index, 101, 101)), 1)
+        self.layer.rollBack()
+        index.disconnect()
+
+    def test_provider_writes(self):
+        """Provider level adds and deletes mark the index stale."""
+        index = TileIndex(self.layer)
+        self.assertEqual(len(self.overlapping(index, 1, 1)), 1)
+
+        # as CreateTileGridAlgorithm does
+        self.layer.dataProvider().addFeatures([tile(50, 50)])
+        self.layer.reload()
+        self.assertTrue(index.stale)
+        index.disconnect()
+        index = TileIndex(self.layer)
+        self.assertEqual(len(self.overlapping(index, 51, 51)), 1)
+
+        # as DeduplicateTilesAlgorithm does
+        fid = self.overlapping(index, 1, 1)[0]
+        self.layer.dataProvider().deleteFeatures([fid])
+        self.layer.reload()
+        self.assertTrue(index.stale)
+        index.disconnect()
+        index = TileIndex(self.layer)
+        self.assertEqual(self.overlapping(index, 1, 1), [])
+        index.disconnect()
+
+    def test_disconnect(self):
+        """A disconnected index ignores edits and can be disconnected again."""
+        index = TileIndex(self.layer)
+        index.disconnect()
+        index.disconnect()
+        self.layer.startEditing()
+        self.layer.addFeature(tile(100, 100))
+        self.assertEqual(self.overlapping(index, 101, 101), [])
+        self.layer.rollBack()
+
+
+if __name__ == "__main__":
+    suite = unittest.makeSuite(HabTileTileIndexTest)
+    runner = unittest.TextTestRunner(verbosity=2)
+    runner.run(suite)
@@ -0,0 +1,151 @@
+# coding=utf-8
+"""Tile cutting helper tests.
+
+.. note:: This program is free software; you can redistribute it and/or modify
+     it under the terms of the GNU General Public License as published by
+     the Free Software Foundation; either version 2 of the License, or
+     (at your option) any later version.
+
+"""
+
+__author__ = 'nick.mortimer@csiro.au'
+__date__ = '2025-07-18'
+__copyright__ = 'Copyright 2025, Nicolas Mortimer'
+
+import os
+import shutil
+import tempfile
+import unittest
+
+import numpy as np
+from osgeo import gdal
+
+from habtile_tiles import (
+    snap_window, blocks_touched, hilbert_index, zorder_index, curve_index, ValidPixelScreen,
+    spatial_split, cut_tiles
+)
+
+
+class HabTileTilesTest(unittest.TestCase):
+    """Test tile window and read order helpers."""
+
+    # 1 m pixels, origin at (1000, 2000), north up
+    GEOTRANSFORM = (1000.0, 1.0, 0.0, 2000.0, 0.0, -1.0)
+
+    def test_snap_window(self):
+        """A box centred on a pixel corner gets integer offsets."""
+        window = snap_window(self.GEOTRANSFORM, (1024, 1024), 1200.4, 1799.6, 256)
+        self.assertEqual(window, (72, 72, 256, 256))
+
+    def test_snap_window_edge(self):
+        """Boxes overlapping the raster edge are shifted inside it."""
+        window = snap_window(self.GEOTRANSFORM, (1024, 1024), 1010.0, 1990.0, 256)
+        self.assertEqual(window, (0, 0, 256, 256))
+        window = snap_window(self.GEOTRANSFORM, (1024, 1024), 2020.0, 980.0, 256)
+        self.assertEqual(window, (768, 768, 256, 256))
+
+    def test_snap_window_rotated(self):
+        """Rotated rasters are not snapped."""
+        geotransform = (1000.0, 1.0, 0.5, 2000.0, 0.5, -1.0)
+        self.assertIsNone(snap_window(geotransform, (1024, 1024), 1200.0, 1800.0, 256))
+
+    def test_blocks_touched(self):
+        """Aligned windows decode one block, straddling windows four."""
+        self.assertEqual(blocks_touched((256, 256, 256, 256), (256, 256)), 1)
+        self.assertEqual(blocks_touched((100, 100, 256, 256), (256, 256)), 4)
+        self.assertEqual(blocks_touched((0, 100, 256, 256), (1024, 1)), 256)
+
+    def test_curves(self):
+        """First-order curves visit the four cells in the expected order."""
+        cells = [(0, 0), (0, 1), (1, 1), (1, 0)]
+        self.assertEqual([hilbert_index(x, y, 1) for x, y in cells], [0, 1, 2, 3])
+        cells = [(0, 0), (1, 0), (0, 1), (1, 1)]
+        self.assertEqual([zorder_index(x, y, 1) for x, y in cells], [0, 1, 2, 3])
+
+    def test_hilbert_neighbours(self):
+        """Consecutive Hilbert positions are adjacent cells."""
+        order = 4
+        cells = sorted(
+            ((x, y) for x in range(16) for y in range(16)),
+            key=lambda cell: hilbert_index(cell[0], cell[1], order)
+        )
+        for (x0, y0), (x1, y1) in zip(cells, cells[1:]):
+            self.assertEqual(abs(x1 - x0) + abs(y1 - y0), 1)
+
+    def test_curve_index_clamps(self):
+        """Points outside the extent are clamped onto the curve."""
+        extent = (0.0, 0.0, 100.0, 100.0)
+        self.assertEqual(curve_index("zorder", -5.0, -5.0, extent), 0)
+        self.assertEqual(
+            curve_index("zorder", 150.0, 150.0, extent),
+            curve_index("zorder", 100.0, 100.0, extent)
+        )
+
+    def test_valid_pixel_screen(self):
+        """Valid fractions come from the overviews of a half-empty raster."""
+        output_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, output_dir)
+        path = os.path.join(output_dir, "half.tif")
+        ds = gdal.GetDriverByName("GTiff").Create(path, 1024, 1024, 1, gdal.GDT_Byte)
+        ds.SetGeoTransform(self.GEOTRANSFORM)
+        data = np.zeros((1024, 1024), dtype=np.uint8)
+        data[:, :512] = 7
+        ds.GetRasterBand(1).WriteArray(data)
+        ds.BuildOverviews("NEAREST", [2, 4, 8, 16, 32, 64])
+        ds = None
+        screen = ValidPixelScreen(path, 256)
+        fractions = screen.fractions([(0, 0, 256, 256), (512, 0, 256, 256), (384, 0, 256, 256)])
+        np.testing.assert_allclose(fractions, [1.0, 0.0, 0.5])
+        self.assertEqual(screen.window_for_bounds(1000.0, 1744.0, 1256.0, 2000.0), (0.0, 0.0, 256.0, 256.0))
+
+    def test_cut_tiles_workers(self):
+        """A process pool cuts the same chips and calls back in tile order."""
+        output_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, output_dir)
+        sources = []
+        for name, value in (("a", 40), ("b", 200)):
+            path = os.path.join(output_dir, f"{name}.tif")
+            ds = gdal.GetDriverByName("GTiff").Create(path, 256, 256, 1, gdal.GDT_Byte)
+            ds.SetGeoTransform(self.GEOTRANSFORM)
+            data = np.add.outer(np.arange(256), np.arange(256)).astype(np.uint8) + value
+            ds.GetRasterBand(1).WriteArray(data)
+            ds = None
+            sources.append(path)
+        # rasters interleaved, so the pool gets several short runs per raster
+        order = [0, 0, 1, 0, 1, 1, 1, 0]
+        results = {}
+        for workers in (1, 2):
+            tiles_dir = os.path.join(output_dir, str(workers))
+            os.makedirs(tiles_dir)
+            tiles = [
+                (sources[source], None, os.path.join(tiles_dir, f"{i}.png"), (i * 20, i * 10, 64, 64))
+                for i, source in enumerate(order)
+            ]
+            calls = []
+            results[workers] = cut_tiles(
+                tiles, workers=workers, chunk_size=2, driver="PNG",
+                callback=lambda index, result: calls.append((index, result))
+            )
+            self.assertEqual(calls, list(enumerate(results[workers])))
+        self.assertNotIn(None, results[1])
+        self.assertEqual(results[1], results[2])
+
+    def test_spatial_split(self):
+        """Blocks stay in one split and each class follows the fractions."""
+        rng = np.random.default_rng(1)
+        x = rng.uniform(0.0, 10000.0, 20000)
+        y = rng.uniform(0.0, 10000.0, 20000)
+        class_ids = rng.integers(0, 3, 20000)
+        splits = spatial_split(x, y, class_ids, 500.0, (0.8, 0.1, 0.1))
+        blocks = np.floor(x / 500.0) * 100 + np.floor(y / 500.0)
+        for block in np.unique(blocks):
+            self.assertEqual(len(np.unique(splits[blocks == block])), 1)
+        for class_id in range(3):
+            shares = np.bincount(splits[class_ids == class_id], minlength=3) / (class_ids == class_id).sum()
+            np.testing.assert_allclose(shares, [0.8, 0.1, 0.1], atol=0.03)
+
+
+if __name__ == "__main__":
+    suite = unittest.makeSuite(HabTileTilesTest)
+    runner = unittest.TextTestRunner(verbosity=2)
+    runner.run(suite)